@@ -0,0 +1,161 @@
+"""
+Population genetics: how the traits of the population change from day to day, for studying selection (on speed,
+mostly) over thousands of days without going through the whole population at every step.
+
+    analytics = PopulationAnalytics()
+    env = Environment(size=200, n=100, headless=True, analytics=analytics)
+    env.simulate(1000)
+    analytics.save('genetics.npz')
+
+Speed and gen get a histogram per day; age and hp only a mean and a variance. Their histograms are left out on
+purpose: both change for everybody every step, so they could only be had by going through the whole population.
+"""
+import os
+from array import array
+from collections import Counter
+
+import numpy as np
+
+# One value per day in the table (see PopulationAnalytics.table)
+FIELDS = ['day', 'step', 'population', 'births', 'deaths', 'speed_mean', 'speed_var', 'gen_mean', 'gen_var',
+          'gen_max', 'age_mean', 'age_var', 'hp_mean', 'hp_var']
+
+
+def moments(n, total, squares):
+    # Mean and variance from the count, the sum and the sum of squares
+    if not n:
+        return float('nan'), float('nan')
+    mean = total / n
+    return mean, max(squares / n - mean * mean, 0.0)
+
+
+class PopulationAnalytics:
+    """
+    Per-day statistics of the population, kept up to date as organisms are born and die.
+
+    An environment with analytics (Environment(..., analytics=PopulationAnalytics())) reports every birth and
+    death to it, tells it after every step that everybody got one step older, and has it close a row of its
+    table at the end of every day.
+
+    Speed and gen never change during an organism's life, so their histograms, and the sums their moments come
+    from, only move when somebody is born or dies. Ages all grow by one every step, so their sum grows by the
+    size of the population n and the sum of their squares by 2 * sum + n. hp changes for everybody every step, depending on what each one ate: it is the only
+    thing summed over the whole population, once per day.
+    """
+    def __init__(self):
+        self.rows = {name: array('d') for name in FIELDS}
+        # Organisms of every speed, one row per day (speeds from 0 to max_speed, 0 is never used)
+        self.speed_histograms = []
+        self.max_speed = 0
+        # Organisms of every generation, one row per day (up to the highest generation alive that day)
+        self.gen_histograms = []
+        self.clear()
+
+    def clear(self):
+        self.count = 0
+        self.speeds = Counter()
+        self.gens = Counter()
+        self.speed_sums = [0, 0]
+        self.gen_sums = [0, 0]
+        self.age_sums = [0, 0]
+        self.births = 0
+        self.deaths = 0
+
+    def reset(self, env):
+        """Starts counting from the population env has now (the environment calls it once, when it is created)."""
+        self.clear()
+        self.max_speed = env.species.max_speed
+        organisms, _ = env.entity_columns()
+        self.added(organisms['speed'].tolist(), organisms['gen'].tolist(), organisms['age'].tolist())
+        self.births = 0
+
+    def added(self, speeds, gens, ages):
+        # Organisms that were born (or loaded): one value of each per organism
+        for speed, gen, age in zip(speeds, gens, ages):
+            self.speeds[speed] += 1
+            self.gens[gen] += 1
+            self.speed_sums[0] += speed
+            self.speed_sums[1] += speed * speed
+            self.gen_sums[0] += gen
+            self.gen_sums[1] += gen * gen
+            self.age_sums[0] += age
+            self.age_sums[1] += age * age
+            self.count += 1
+            self.births += 1
+
+    def removed(self, speeds, gens, ages):
+        # Organisms that died
+        for speed, gen, age in zip(speeds, gens, ages):
+            self.speeds[speed] -= 1
+            self.gens[gen] -= 1
+            if not self.gens[gen]:
+                del self.gens[gen]
+            self.speed_sums[0] -= speed
+            self.speed_sums[1] -= speed * speed
+            self.gen_sums[0] -= gen
+            self.gen_sums[1] -= gen * gen
+            self.age_sums[0] -= age
+            self.age_sums[1] -= age * age
+            self.count -= 1
+            self.deaths += 1
+
+    def aged(self, n):
+        # n organisms are getting one step older (before the step, so that those dying in it go at their new age)
+        self.age_sums[1] += 2 * self.age_sums[0] + n
+        self.age_sums[0] += n
+
+    def end_day(self, env):
+        """Adds the row of the day that just ended to the table."""
+        speed_mean, speed_var = moments(self.count, *self.speed_sums)
+        gen_mean, gen_var = moments(self.count, *self.gen_sums)
+        age_mean, age_var = moments(self.count, *self.age_sums)
+        hp_mean, hp_var = moments(*env.hp_moments())
+        values = {
+            'day': env.day,
+            'step': env.total_steps,
+            'population': self.count,
+            'births': self.births,
+            'deaths': self.deaths,
+            'speed_mean': speed_mean,
+            'speed_var': speed_var,
+            'gen_mean': gen_mean,
+            'gen_var': gen_var,
+            'gen_max': max(self.gens) if self.gens else float('nan'),
+            'age_mean': age_mean,
+            'age_var': age_var,
+            'hp_mean': hp_mean,
+            'hp_var': hp_var,
+        }
+        for name, value in values.items():
+            self.rows[name].append(value)
+        self.speed_histograms.append([self.speeds[speed] for speed in range(self.max_speed + 1)])
+        self.gen_histograms.append([self.gens[gen] for gen in range(max(self.gens) + 1)] if self.gens else [])
+        self.births = 0
+        self.deaths = 0
+
+    def __len__(self):
+        return len(self.rows['day'])
+
+    def table(self):
+        """
+        Returns:
+            dict: one NumPy array per field (see FIELDS), with one value per day, plus 'speed_histogram': a days x
+            (max_speed + 1) array with how many organisms had each speed at the end of every day, and
+            'gen_histogram', the same for generations: days x (highest generation ever seen + 1), padded with zeros.
+        """
+        table = {name: np.frombuffer(values, dtype=np.float64).copy() for name, values in self.rows.items()}
+        for name in ('day', 'step', 'population', 'births', 'deaths'):
+            table[name] = table[name].astype(np.int64)
+        table['speed_histogram'] = np.array(self.speed_histograms, dtype=np.int64).reshape(-1, self.max_speed + 1)
+        width = max(map(len, self.gen_histograms), default=0)
+        table['gen_histogram'] = np.zeros((len(self.gen_histograms), width), dtype=np.int64)
+        for day, histogram in enumerate(self.gen_histograms):
+            table['gen_histogram'][day, :len(histogram)] = histogram
+        return table
+
+    def save(self, path):
+        """Writes the table to path (.npz). Like checkpoints, the file is written next to path and then moved in place."""
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, **self.table())
+        os.replace(tmp_path, path)
@@ -0,0 +1,576 @@
+from functools import lru_cache
+
+import numpy as np
+
+from columns import ColumnsSequence, FoodColumns, FoodView, OrganismColumns, OrganismView
+from env import Environment
+from neighbourhood import offsets
+from rng import Streams
+from snapshot import FoodSnapshot
+
+# (dx, dy) for each direction, in the same order as columns.DIRECTIONS
+STEPS = np.array([(0, 1), (0, -1), (-1, 0), (1, 0)], dtype=np.int32)
+
+
+@lru_cache(maxsize=None)
+def neighbour_offsets(radius):
+    table = np.array(offsets(radius), dtype=np.int32)
+    table.flags.writeable = False
+    return table
+
+
+# The rules of a step that only touch the rows they are given. They work on plain arrays (see
+# ArrayEnvironment.arrays): ArrayEnvironment runs them on all its rows at once, ParallelArrayEnvironment on
+# ranges of rows in its worker processes. Whatever involves other rows or a random stream is left to the caller.
+
+def update_organisms_part(arrays, start, stop):
+    """Ages and feeds rows [start, stop), and returns the rows that died."""
+    o = arrays['organisms']
+    age, hp, hunger = o['age'][start:stop], o['hp'][start:stop], o['hunger'][start:stop]
+
+    # You lived another day! Huzzah!
+    age += 1
+
+    # Basic rate of hunger depletion, bottoming out at -20
+    hunger -= 1
+    np.maximum(hunger, -20, out=hunger)
+
+    # With hunger negative, organisms lose hp, with hunger positive they gain it (up to 100)
+    hp[hunger <= 0] -= 2
+    hp[hunger > 0] += 1
+    np.minimum(hp, 100, out=hp)
+
+    # Organisms with no hp die (the caller leaves food behind them)
+    alive = o['alive'][start:stop]
+    dead = alive & (hp <= 0)
+    alive[dead] = False
+    return np.flatnonzero(dead) + start
+
+
+def move_rows(arrays, movers):
+    """
+    Moves the organisms in rows movers one cell in their direction, wrapping around the edges.
+
+    Returns:
+        tuple: the movers that landed on food, and the food rows they landed on (who gets to eat is up to the
+        caller, see ArrayEnvironment.eat).
+    """
+    o, food_grid = arrays['organisms'], arrays['food_grid']
+    size = len(food_grid)
+    x, y = o['x'], o['y']
+    moves = STEPS[o['direction'][movers]]
+    x[movers] = (x[movers] + moves[:, 0]) % size
+    y[movers] = (y[movers] + moves[:, 1]) % size
+    food_rows = food_grid[x[movers], y[movers]]
+    found = food_rows >= 0
+    return movers[found], food_rows[found]
+
+
+def update_food_part(arrays, start, stop, food_decay, track_dirty):
+    """
+    Ages (and decays) the food in rows [start, stop).
+
+    Returns:
+        tuple: the rows that rotted away, the rows that look different now (or None) and the rows ready to seed.
+    """
+    f = arrays['foods']
+    alive = f['alive'][start:stop].copy()
+    age, decay = f['age'][start:stop], f['decay'][start:stop]
+    age[alive] += 1
+    rotten = np.empty(0, dtype=np.int64)
+    if food_decay:
+        decay[alive] -= 1
+        rotten = np.flatnonzero(alive & (decay == 0)) + start
+
+    # Sprouts growing up and food starting to wilt look different
+    changed = None
+    if track_dirty:
+        changed = np.flatnonzero(alive & ((age == 11) | (decay == 9))) + start
+    # Food about to rot spreads its seeds around
+    seeders = np.flatnonzero(alive & (decay < 6) & ~f['pollinated'][start:stop]) + start
+    return rotten, changed, seeders
+
+
+class ArrayEnvironment(Environment):
+    """
+    Same world and same rules as Environment, but organisms and food are stored as NumPy columns
+    (see columns.py) and hunger, hp, age, pregnancy and decay are updated for everyone at once.
+
+    population and food are read-only sequences of views, so the renderer and inspection keep working.
+    Differences from the object backend: the world wraps around on exactly size cells, there is at most
+    one food item per cell, and an organism dies as soon as its hp reaches 0 or less.
+    """
+    def create_streams(self):
+        return Streams(self.seed, np.random.default_rng)
+
+    organism_columns = OrganismColumns
+    food_columns = FoodColumns
+
+    def create_storage(self):
+        self.organisms = self.organism_columns()
+        self.foods = self.food_columns()
+        # food_grid[x, y] is the row of the food item on that cell, or -1
+        self.food_grid = np.full((self.size, self.size), -1, dtype=np.int32)
+        # organism_grid[x, y] is the lowest row of the organisms on that cell, or -1. Only inspection asks for it,
+        # so headless runs don't keep it (see index_organisms)
+        self.organism_grid = None if self.headless else np.full((self.size, self.size), -1, dtype=np.int32)
+        self.indexed_keys = np.empty(0, dtype=np.int64)
+
+        # The view inspection is following, and for food, the cell it was on the last time we looked (see follow)
+        self.followed = None
+        self.followed_at = None
+
+        # Keys (x * size + y) of the cells that changed since the last frame, None when nobody needs them
+        self.dirty_keys = None if self.headless and self.replay is None else []
+
+
+    @property
+    def population(self):
+        return ColumnsSequence(self.organisms, OrganismView)
+
+    @property
+    def food(self):
+        return ColumnsSequence(self.foods, FoodView)
+
+    @property
+    def food_map(self):
+        return {food.coord: food for food in self.food}
+
+    @property
+    def organism_map(self):
+        return {organism.coord: organism for organism in self.population}
+
+    def entity_columns(self):
+        organisms = {name: self.organisms.data[name][:len(self.organisms)].copy() for name in OrganismColumns.fields if name != 'alive'}
+        food = {name: self.foods.data[name][:len(self.foods)].copy() for name in FoodColumns.fields if name != 'alive'}
+        return organisms, food
+
+    def load_entity_columns(self, organisms, food):
+        self.create_storage()
+
+        # Checkpoints of the object backend may have entities just past the edge (we wrap them around)
+        # and more than one food item on a cell (we keep the first one)
+        for columns in (organisms, food):
+            columns['x'] = columns['x'] % self.size
+            columns['y'] = columns['y'] % self.size
+        # (the array backend keeps no lineage: it is all in the object backend's organisms)
+        organisms.pop('lineage', None)
+        self.organisms.append(len(organisms['x']), **organisms)
+        self.index_organisms()
+
+        _, first = np.unique(food['x'].astype(np.int64) * self.size + food['y'], return_index=True)
+        first = np.sort(first)
+        rows = self.foods.append(len(first), **{name: column[first] for name, column in food.items()})
+        self.food_grid[self.foods.x, self.foods.y] = np.arange(rows.start, rows.stop, dtype=np.int32)
+        self.mark_dirty(self.organisms.x, self.organisms.y)
+        self.mark_dirty(self.foods.x, self.foods.y)
+
+        if self.analytics is not None:
+            # Whoever was loaded is where the counts start from, not a birth
+            self.analytics.reset(self)
+        if self.replay is not None:
+            # What was recorded so far is the empty world we were loaded into
+            self.replay.restart(self)
+
+    def mark_dirty(self, x, y):
+        if self.dirty_keys is not None:
+            self.dirty_keys.append(np.atleast_1d(x).astype(np.int64) * self.size + np.atleast_1d(y))
+
+    def pop_dirty_cells(self):
+        if self.dirty_keys is None:
+            return None
+        keys = np.unique(np.concatenate(self.dirty_keys)) if self.dirty_keys else np.empty(0, dtype=np.int64)
+        self.dirty_keys.clear()
+        return set(zip((keys // self.size).tolist(), (keys % self.size).tolist()))
+
+    def entities_in(self, cells):
+        if not cells:
+            return [], []
+        cx, cy = (np.array(axis, dtype=np.int64) for axis in zip(*cells))
+        o = self.organisms
+        rows = np.flatnonzero(np.isin(o.x.astype(np.int64) * self.size + o.y, cx * self.size + cy))
+        food_rows = self.food_grid[cx, cy]
+        return ([OrganismView(o, row) for row in rows.tolist()],
+                [FoodView(self.foods, row) for row in food_rows[food_rows >= 0].tolist()])
+
+    def entities_in_area(self, x0, y0, x1, y1):
+        o, f = self.organisms, self.foods
+        rows = np.flatnonzero((o.x >= x0) & (o.x < x1) & (o.y >= y0) & (o.y < y1))
+        food_rows = self.food_grid[x0:x1, y0:y1]
+        return ([OrganismView(o, row) for row in rows.tolist()],
+                [FoodView(f, row) for row in food_rows[food_rows >= 0].tolist()])
+
+    def random_cells(self, n):
+        """
+        Returns:
+            tuple: the x and y of n different cells (or of every cell, if the world is smaller than that), picked
+            at random in one go.
+        """
+        size = self.size
+        keys = self.streams.spawn.choice(size * size, min(n, size * size), replace=False)
+        return (keys // size).astype(np.int32), (keys % size).astype(np.int32)
+
+    def occupied_cells(self):
+        # (organisms sharing a cell are there twice: the heatmap doesn't mind)
+        o, f = self.organisms, self.foods
+        return o.x, o.y, f.x, f.y
+
+    def populate(self):
+        # Every organism starts on a cell of its own
+        self.spawn_organisms(*self.random_cells(self.n), gen=0)
+        self.index_organisms()
+
+    def spawn_organisms(self, x, y, gen, speed=None):
+        n = len(x)
+        spawn = self.streams.spawn
+        if speed is None:
+            speed = np.minimum(spawn.integers(1, 3, n), self.species.max_speed)
+        self.mark_dirty(x, y)
+        rows = self.organisms.append(n, x=x, y=y, gen=gen, hp=100, hunger=100, speed=speed,
+                                     number=spawn.integers(0, 1000000, n),
+                                     direction=self.streams.move.integers(0, 4, n))
+        if self.analytics is not None:
+            o = self.organisms
+            self.analytics.added(o.speed[rows].tolist(), o.gen[rows].tolist(), [0] * n)
+
+    def spawn_food(self, x, y, gen=1, age=0):
+        # Only one food item per cell: drop the cells that are already taken, and duplicates in this batch
+        x = np.asarray(x, dtype=np.int32)
+        y = np.asarray(y, dtype=np.int32)
+        _, first = np.unique(x.astype(np.int64) * self.size + y, return_index=True)
+        first = np.sort(first)
+        x, y = x[first], y[first]
+        free = self.food_grid[x, y] == -1
+        x, y = x[free], y[free]
+        if np.ndim(gen):
+            gen = np.asarray(gen)[first][free]
+
+        n = len(x)
+        self.mark_dirty(x, y)
+        rows = self.foods.append(n, x=x, y=y, gen=gen, age=age, decay=self.streams.food.integers(40, 121, n))
+        self.food_grid[x, y] = np.arange(rows.start, rows.stop, dtype=np.int32)
+        return n
+
+    def add_food_to_env(self, n=None):
+        if not n:
+            n = self.regrowth_rate
+        if self.first_time_food:
+            # The initial food is grown up already, and lands on n different cells
+            self.first_time_food = False
+            self.spawn_food(*self.random_cells(n), age=11)
+            return
+        spawn = self.streams.spawn
+        self.spawn_food(spawn.integers(0, self.size, n), spawn.integers(0, self.size, n))
+
+    def remove_food_rows(self, rows):
+        f = self.foods
+        f.alive[rows] = False
+        self.food_grid[f.x[rows], f.y[rows]] = -1
+        self.mark_dirty(f.x[rows], f.y[rows])
+
+    def sample_free_neighbours(self, x, y, counts, radius, rng, taken):
+        """
+        Up to counts[i] different random cells within radius of every (x[i], y[i]), among those inside the world
+        and not taken. Same as neighbourhood.sample_free_neighbours, for many cells at once.
+
+        Args:
+            x, y (np.ndarray): The cells in the middle.
+            counts (np.ndarray): How many cells we would like around each one.
+            radius (int): How far from the middle they can be.
+            rng (np.random.Generator): The stream the picks are drawn from.
+            taken (callable): taken(cx, cy) tells which of the cells (cx, cy) can't be picked.
+
+        Returns:
+            tuple: the x and y of the picked cells, and for each one the index of the cell it was picked around.
+        """
+        table = neighbour_offsets(radius)
+        cx = x[:, None] + table[:, 0]
+        cy = y[:, None] + table[:, 1]
+        ok = (cx >= 0) & (cx < self.size) & (cy >= 0) & (cy < self.size)
+        ok[ok] = ~taken(cx[ok], cy[ok])
+
+        # Every row of candidates in a random order, with those that can't be picked at the end,
+        # then the first counts[i] of row i (as long as they can be picked)
+        keys = rng.random(cx.shape)
+        keys[~ok] = 2
+        order = np.argsort(keys, axis=1)
+        picked = (np.arange(len(table)) < np.asarray(counts)[:, None]) & np.take_along_axis(ok, order, axis=1)
+        rows, columns = np.nonzero(picked)
+        columns = order[rows, columns]
+        return cx[rows, columns], cy[rows, columns], rows
+
+    def run_step(self):
+        self.steps_today += 1
+        self.total_steps += 1
+        self.record_history()
+
+        probe = self.instrumentation
+        if not probe:
+            self.update_organisms()
+            self.move_organisms()
+            self.breed()
+            self.update_food()
+            self.compact()
+        else:
+            start = probe.clock()
+            self.update_organisms()
+            start = probe.lap('organisms', start)
+            self.move_organisms()
+            start = probe.lap('movement', start)
+            self.breed()
+            start = probe.lap('births', start)
+            self.update_food()
+            start = probe.lap('food', start)
+            self.compact()
+            probe.lap('compact', start)
+
+        if self.steps_today == self.steps_per_day:
+            self.day_complete = True
+
+    def hp_moments(self):
+        hp = self.organisms.hp.astype(np.int64)
+        return len(hp), int(hp.sum()), int((hp * hp).sum())
+
+    def metrics_record(self):
+        o = self.organisms
+        n = len(o)
+        return {
+            'step': self.total_steps,
+            'day': self.day,
+            'population': n,
+            'food': len(self.foods),
+            'births': self.births,
+            'deaths': self.deaths,
+            'mean_hp': float(o.hp.mean()) if n else None,
+            'mean_hunger': float(o.hunger.mean()) if n else None,
+            'mean_speed': float(o.speed.mean()) if n else None,
+            'mean_gen': float(o.gen.mean()) if n else None,
+        }
+
+    def arrays(self):
+        # The columns (rows in use only) and the food grid, for the rule functions at the top of this module
+        return {'organisms': {name: column[:len(self.organisms)] for name, column in self.organisms.data.items()},
+                'foods': {name: column[:len(self.foods)] for name, column in self.foods.data.items()},
+                'food_grid': self.food_grid}
+
+    def update_organisms(self):
+        self.bury(update_organisms_part(self.arrays(), 0, len(self.organisms)))
+
+    def bury(self, rows):
+        # rows just died: what's left of them becomes food
+        o = self.organisms
+        self.deaths += len(rows)
+        if self.analytics is not None:
+            self.analytics.removed(o.speed[rows].tolist(), o.gen[rows].tolist(), o.age[rows].tolist())
+        self.mark_dirty(o.x[rows], o.y[rows])
+        self.spawn_food(o.x[rows], o.y[rows])
+
+    def move_organisms(self):
+        """
+        Moves every organism one cell per sub-step, up to its speed, eating whatever it finds on the way.
+
+        Each sub-step is a handful of array operations over all the organisms that still have moves left:
+        step in the current direction, wrap around the edges, draw the next direction, then eat.
+        """
+        o = self.organisms
+        arrays = self.arrays()
+        x, y, speed, direction = o.x, o.y, o.speed, o.direction
+        movers = np.flatnonzero(o.alive & (speed > 0))
+        step = 0
+        while len(movers):
+            self.mark_dirty(x[movers], y[movers])
+            rows, food_rows = move_rows(arrays, movers)
+            self.mark_dirty(x[movers], y[movers])
+            direction[movers] = self.streams.move.integers(0, 4, len(movers))
+            meals = self.eat(rows, food_rows)
+            if self.instrumentation:
+                self.instrumentation.count('moves', len(movers))
+                self.instrumentation.count('meals', meals)
+
+            step += 1
+            movers = movers[speed[movers] > step]
+
+    def eat(self, rows, food_rows):
+        # The organisms in rows (in row order) landed on food_rows. When more than one organism lands on the same
+        # food item in the same sub-step, the one with the lowest row (that is, the oldest) gets it.
+        o = self.organisms
+        food_rows, first = np.unique(food_rows, return_index=True)
+        rows = rows[first]
+
+        values = np.where(self.foods.age[food_rows] > 10, 20, 5)
+        o.hunger[rows] = np.minimum(o.hunger[rows] + values, 100)
+        self.remove_food_rows(food_rows)
+        return len(food_rows)
+
+    def breed(self):
+        o = self.organisms
+        alive, pregnant, steps_pregnant = o.alive, o.pregnant, o.steps_pregnant
+
+        steps_pregnant[alive & pregnant] += 1
+
+        # We check who becomes pregnant...
+        ready = (
+            alive
+            & ~pregnant
+            & (o.age > self.species.minimum_steps_to_maturity)
+            & (self.total_steps - o.last_birth > self.species.steps_between_births)
+        )
+        lucky = ready & (self.streams.breed.integers(0, 11, len(o)) < 2)
+        pregnant[lucky] = True
+        steps_pregnant[lucky] = 0
+
+        # ...and who gives birth
+        mothers = np.flatnonzero(alive & pregnant & (steps_pregnant >= self.species.pregancy_duration_steps))
+        if not len(mothers):
+            return
+        pregnant[mothers] = False
+        o.last_birth[mothers] = self.total_steps
+        steps_pregnant[mothers] = 0
+
+        hp = o.hp
+        healthy = mothers[hp[mothers] > 50]
+        weak = mothers[hp[mothers] <= 50]
+        hp[healthy] -= 30
+        hp[weak] -= 10 # This is like an abortion
+        self.spawn_food(o.x[weak], o.y[weak])
+
+        # One baby per healthy mother, on a random neighbouring cell that no organism is using
+        # (and when two mothers pick the same cell, the first one gets it)
+        taken = o.x[alive].astype(np.int64) * self.size + o.y[alive]
+        bx, by, mother = self.sample_free_neighbours(
+            o.x[healthy], o.y[healthy], np.ones(len(healthy), dtype=np.int64), 1, self.streams.breed,
+            lambda cx, cy: np.isin(cx.astype(np.int64) * self.size + cy, taken))
+        _, first = np.unique(bx.astype(np.int64) * self.size + by, return_index=True)
+        first = np.sort(first)
+        self.births += len(first)
+        # Babies get their mother's speed, give or take a mutation (see Species)
+        parents = healthy[mother[first]]
+        breed, species = self.streams.breed, self.species
+        mutations = (breed.random(len(parents)) < species.mutation_rate) * breed.choice((-1, 1), len(parents))
+        speed = np.clip(o.speed[parents] + mutations, 1, species.max_speed)
+        self.spawn_organisms(bx[first], by[first], gen=o.gen[parents] + 1, speed=speed)
+
+    def update_food(self):
+        f = self.foods
+        rotten, changed, seeders = update_food_part(self.arrays(), 0, len(f), self.food_decay,
+                                                    self.dirty_keys is not None)
+        self.remove_food_rows(rotten)
+        if changed is not None:
+            self.mark_dirty(f.x[changed], f.y[changed])
+        self.plant_seeds(seeders)
+
+    def plant_seeds(self, seeders):
+        if not len(seeders):
+            return
+        f = self.foods
+        f.pollinated[seeders] = True
+        n_seeds = self.streams.food.integers(0, 4, len(seeders))
+        sx, sy, parent = self.sample_free_neighbours(f.x[seeders], f.y[seeders], n_seeds, 2, self.streams.food,
+                                                     lambda cx, cy: self.food_grid[cx, cy] >= 0)
+        seeds = self.spawn_food(sx, sy, gen=f.gen[seeders][parent] + 1)
+        if self.instrumentation:
+            self.instrumentation.count('seeds', seeds)
+
+    def compact(self):
+        self.track_followed(self.organisms.alive)
+        self.organisms.keep(self.organisms.alive)
+        f = self.foods
+        f.keep(f.alive)
+        self.food_grid[f.x, f.y] = np.arange(len(f), dtype=np.int32)
+        self.index_organisms()
+
+    def index_organisms(self):
+        # Brings organism_grid up to date, at the end of every step like food_grid: only the cells indexed last
+        # time are cleared, and the lowest row on a cell wins (minimum.at, whatever order the rows come in)
+        if self.organism_grid is None:
+            return
+        o = self.organisms
+        grid = self.organism_grid.reshape(-1)
+        grid[self.indexed_keys] = -1
+        keys = o.x.astype(np.int64) * self.size + o.y
+        grid[keys] = len(o)
+        np.minimum.at(grid, keys, np.arange(len(o), dtype=np.int32))
+        self.indexed_keys = keys
+
+    def track_followed(self, alive):
+        # Moves the followed organism's view to the row it will have once the rows not alive are dropped (-1 if
+        # it is one of them): it has no other way to be found again for sure (see follow)
+        if isinstance(self.followed, OrganismView) and self.followed.row >= 0:
+            row = self.followed.row
+            object.__setattr__(self.followed, 'row', int(np.count_nonzero(alive[:row])) if alive[row] else -1)
+
+    def end_day(self):
+        # If for whatever reasons there are orgasnism alive with no hp, kill them
+        o = self.organisms
+        dead = o.hp <= 0
+        self.deaths += int(dead.sum())
+        if self.analytics is not None:
+            self.analytics.removed(o.speed[dead].tolist(), o.gen[dead].tolist(), o.age[dead].tolist())
+        o.alive[dead] = False
+        self.track_followed(o.alive)
+        o.keep(o.alive)
+        self.index_organisms()
+
+        self.day += 1
+        self.steps_today = 0
+        self.day_complete = False
+
+    def get_positions(self):
+        return list(zip(self.organisms.x.tolist(), self.organisms.y.tolist()))
+
+    def get_food_positions(self, n=None):
+        return list(zip(self.foods.x.tolist(), self.foods.y.tolist()))
+
+    def get_entity_on_coord(self, mouse_pos):
+        return self.entity_at((mouse_pos[0] // self.scale, mouse_pos[1] // self.scale))
+
+    def follow(self, entity):
+        """
+        Returns entity as it is now, or None once it is gone. A view is a row, and rows move when the columns are
+        compacted: the followed organism's view is moved along with its row (see track_followed), food is found
+        again by its cell.
+        """
+        if entity is not self.followed:
+            # Just picked: the view is still good
+            self.followed = entity
+            self.followed_at = entity.coord if isinstance(entity, FoodView) else None
+            return entity
+        if isinstance(entity, FoodView):
+            x, y = self.followed_at
+            object.__setattr__(entity, 'row', int(self.food_grid[x, y]))
+        if entity.row < 0:
+            self.followed = self.followed_at = None
+            return None
+        return entity
+
+    def find_row(self, coord, number):
+        # The row of the food on coord (number is None), or of the organism with number closest to coord; -1 if none.
+        # Organisms are looked for in the whole column: this is only done once per click (see find)
+        x, y = coord
+        if number is None:
+            return int(self.food_grid[x, y])
+        o = self.organisms
+        rows = np.flatnonzero(o.number == number)
+        return int(rows[np.argmin(np.abs(o.x[rows] - x) + np.abs(o.y[rows] - y))]) if len(rows) else -1
+
+    def find(self, picked):
+        if isinstance(picked, FoodSnapshot):
+            row = self.find_row(picked.coord, None)
+            return FoodView(self.foods, row) if row >= 0 else None
+        row = self.find_row(picked.coord, picked.number)
+        return OrganismView(self.organisms, row) if row >= 0 else None
+
+    def entity_at(self, cell):
+        x, y = cell
+        if not (0 <= x < self.size and 0 <= y < self.size):
+            return None
+        food_row = self.food_grid[x, y]
+        if food_row >= 0:
+            return FoodView(self.foods, int(food_row))
+        if self.organism_grid is not None:
+            row = int(self.organism_grid[x, y])
+            return OrganismView(self.organisms, row) if row >= 0 else None
+        rows = np.flatnonzero((self.organisms.x == x) & (self.organisms.y == y))
+        if len(rows):
+            return OrganismView(self.organisms, int(rows[0]))
+        return None
@@ -0,0 +1,145 @@
+"""
+Runs many headless simulations in parallel and aggregates their population and food curves.
+
+    python batch.py --size 50 100 --n 20 40 --food-density 0.05 0.1 --seeds 5 --days 20 --out sweep.csv
+
+Every combination of the given parameters is simulated once per seed, across a pool of worker processes.
+For every configuration and every step the output has the mean of the population and food counts over the
+seeds, with a 95% confidence band.
+"""
+import argparse
+import csv
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from checkpoint import environment_class_for
+from rng import derive_seed
+
+PARAMETERS = ['size', 'n', 'food_density', 'regrowth_rate', 'food_decay']
+
+
+def parameter_grid(**values):
+    """
+    Every combination of the given parameter values, e.g. parameter_grid(size=[50, 100], n=[20]).
+
+    Returns:
+        list: one dict of parameters per combination.
+    """
+    names = list(values)
+    return [dict(zip(names, combination)) for combination in itertools.product(*values.values())]
+
+
+def make_environment(config, backend='object', seed=None):
+    return environment_class_for(backend)(headless=True, seed=seed, **config)
+
+
+def config_seed(base_seed, config, replicate):
+    # Depends only on the configuration itself (not on its place in the grid), so a run can be cached
+    # and re-run on its own
+    return derive_seed(base_seed, tuple(sorted(config.items())), replicate)
+
+
+def run_one(config, seed, days, backend='object'):
+    """
+    Runs one headless simulation, fully determined by config, seed and days.
+
+    Returns:
+        tuple: the population and food counts, one per step.
+    """
+    env = make_environment(config, backend, seed)
+    env.simulate(days)
+    return env.pop_count, env.food_count
+
+
+def _run_job(job):
+    return run_one(*job)
+
+
+def summarize(runs):
+    """
+    Mean and 95% confidence band, step by step, of a list of time series of the same length.
+    """
+    runs = np.asarray(runs, dtype=float)
+    mean = runs.mean(axis=0)
+    if len(runs) > 1:
+        half_width = 1.96 * runs.std(axis=0, ddof=1) / np.sqrt(len(runs))
+    else:
+        half_width = np.zeros_like(mean)
+    return mean, mean - half_width, mean + half_width
+
+
+def run_grid(grid, seeds=1, days=20, workers=None, backend='object', base_seed=0):
+    """
+    Runs every configuration of grid once per seed, spread over a pool of worker processes.
+
+    Args:
+        grid (list): configurations, as returned by parameter_grid().
+        seeds (int, optional): Number of runs per configuration. Defaults to 1.
+        days (int, optional): Days to simulate in every run. Defaults to 20.
+        workers (int, optional): Worker processes. Defaults to None, which will use one per CPU.
+        backend (str, optional): 'object' for Environment, 'array' for ArrayEnvironment. Defaults to 'object'.
+        base_seed (int, optional): Seed every run's own seed is derived from. Defaults to 0.
+
+    Returns:
+        list: one dict per configuration, with the configuration itself and the 'population' and 'food'
+        summaries (mean, low, high) over the seeds.
+    """
+    jobs = [(config, config_seed(base_seed, config, replicate), days, backend)
+            for config in grid for replicate in range(seeds)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_run_job, jobs))
+
+    summaries = []
+    for index, config in enumerate(grid):
+        runs = results[index * seeds:(index + 1) * seeds]
+        summaries.append({
+            'config': config,
+            'population': summarize([population for population, _ in runs]),
+            'food': summarize([food for _, food in runs]),
+        })
+    return summaries
+
+
+def write_csv(summaries, path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(PARAMETERS + ['step', 'pop_mean', 'pop_low', 'pop_high', 'food_mean', 'food_low', 'food_high'])
+        for summary in summaries:
+            params = [summary['config'].get(name, '') for name in PARAMETERS]
+            columns = zip(*summary['population'], *summary['food'])
+            for step, values in enumerate(columns, start=1):
+                writer.writerow(params + [step] + [round(value, 3) for value in values])
+
+
+def parse_bool(value):
+    return value.lower() in ('1', 'true', 'yes', 'y')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a parameter sweep of headless simulations.')
+    parser.add_argument('--size', type=int, nargs='+', default=[50])
+    parser.add_argument('--n', type=int, nargs='+', default=[30])
+    parser.add_argument('--food-density', type=float, nargs='+', default=[0.1])
+    parser.add_argument('--regrowth-rate', type=int, nargs='+', default=[5])
+    parser.add_argument('--food-decay', type=parse_bool, nargs='+', default=[True])
+    parser.add_argument('--seeds', type=int, default=1, help='runs per configuration')
+    parser.add_argument('--days', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0, help='base seed, every run derives its own from it')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--backend', choices=['object', 'array'], default='object')
+    parser.add_argument('--out', default='sweep.csv')
+    args = parser.parse_args(argv)
+
+    grid = parameter_grid(size=args.size, n=args.n, food_density=args.food_density,
+                          regrowth_rate=args.regrowth_rate, food_decay=args.food_decay)
+    print(f"Running {len(grid)} configurations x {args.seeds} seeds for {args.days} days...")
+    summaries = run_grid(grid, seeds=args.seeds, days=args.days, workers=args.workers, backend=args.backend,
+                         base_seed=args.seed)
+    write_csv(summaries, args.out)
+    print(f"Results written to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Compares two benchmark results written by benchmarks/run.py, e.g. before and after a change:
+
+    python -m benchmarks.compare base.json new.json --threshold 0.1
+
+Measures are matched by benchmark, backend and configuration. For each one the ratio new/base of the time
+per step (or per frame) is printed, and measures more than --threshold slower are reported as regressions.
+The exit status is 1 if there are any, so the comparison can gate a CI job.
+"""
+import argparse
+import json
+import sys
+
+KEY = ['benchmark', 'mode', 'backend', 'size', 'n', 'food_density', 'scale']
+
+
+def result_key(result):
+    return tuple((name, result[name]) for name in KEY if name in result)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(base, new, threshold=0.1):
+    """
+    Matches the results of two reports.
+
+    Returns:
+        list: (key, base seconds, new seconds, ratio, verdict) for every measure found in both reports, where
+        verdict is 'regression' when new is more than threshold slower, 'faster' when it is more than threshold
+        faster, and None otherwise.
+    """
+    base_results = {result_key(result): result for result in base['results']}
+    rows = []
+    for result in new['results']:
+        key = result_key(result)
+        if key in base_results:
+            old = base_results[key]['seconds_per_op']
+            ratio = result['seconds_per_op'] / old
+            verdict = None
+            if ratio > 1 + threshold:
+                verdict = 'regression'
+            elif ratio < 1 - threshold:
+                verdict = 'faster'
+            rows.append((key, old, result['seconds_per_op'], ratio, verdict))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare two benchmark reports.')
+    parser.add_argument('base')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative slowdown reported as a regression (default: 0.1, i.e. 10%%)')
+    args = parser.parse_args(argv)
+
+    base, new = load(args.base), load(args.new)
+    print(f"base: {base.get('commit')}  new: {new.get('commit')}")
+    regressions = 0
+    for key, old, current, ratio, verdict in compare(base, new, args.threshold):
+        label = ' '.join(f'{name}={value}' for name, value in key)
+        flag = ''
+        if verdict == 'regression':
+            flag = '  REGRESSION'
+            regressions += 1
+        elif verdict == 'faster':
+            flag = '  faster'
+        print(f"{label:70} {1000 * old:9.3f} ms -> {1000 * current:9.3f} ms  x{ratio:5.2f}{flag}")
+
+    for backend, exponent in new.get('scaling_exponent', {}).items():
+        old = base.get('scaling_exponent', {}).get(backend)
+        if exponent is not None and old is not None:
+            print(f"scaling exponent {backend}: {old:.2f} -> {exponent:.2f}")
+
+    if regressions:
+        print(f"{regressions} regression(s) above {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""
+Checks that ParallelArrayEnvironment gives the same run whatever the number of workers, and times it.
+
+    python -m benchmarks.parallel
+    python -m benchmarks.parallel --workers 1 2 4 --size 300 --n 20000 --steps 40
+
+(run from the repository root). The same seed is simulated once per --workers value. Every run after the
+first is compared with the first one: population and food curves (pop_count and food_count) and the final
+positions of organisms and food. --min-rows-per-worker is small by default so that even small worlds are
+really split between the workers. The exit status is 1 if any run differs.
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from parallel_env import ParallelArrayEnvironment
+
+
+def run(workers, args):
+    """
+    Returns:
+        tuple: the state of the world after args.steps steps (see state()) and the seconds per step.
+    """
+    env = ParallelArrayEnvironment(size=args.size, n=args.n, food_density=args.food_density, headless=True,
+                                   seed=args.seed, workers=workers, min_rows_per_worker=args.min_rows_per_worker)
+    try:
+        # (simulate() counts days: steps are run one by one, like benchmarks/run.py does)
+        start = time.perf_counter()
+        for _ in range(args.steps):
+            env.advance()
+        elapsed = time.perf_counter() - start
+        return state(env), elapsed / args.steps
+    finally:
+        env.close()
+
+
+def state(env):
+    organisms, foods = env.organisms, env.foods
+    organism_positions = np.stack([organisms.x, organisms.y], axis=1)
+    food_positions = np.stack([foods.x, foods.y], axis=1)
+    return {
+        'pop_count': list(env.pop_count),
+        'food_count': list(env.food_count),
+        'organisms': organism_positions[np.lexsort(organism_positions.T)].tolist(),
+        'food': food_positions[np.lexsort(food_positions.T)].tolist(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare ParallelArrayEnvironment runs with different numbers of workers.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 3, 4])
+    parser.add_argument('--size', type=int, default=60)
+    parser.add_argument('--n', type=int, default=200)
+    parser.add_argument('--food-density', type=float, default=0.2)
+    parser.add_argument('--steps', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=11)
+    parser.add_argument('--min-rows-per-worker', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    reference = None
+    differences = 0
+    for workers in args.workers:
+        result, seconds = run(workers, args)
+        if reference is None:
+            reference = result
+            verdict = 'reference'
+        else:
+            different = [name for name in reference if result[name] != reference[name]]
+            differences += bool(different)
+            verdict = 'DIFFERS: ' + ', '.join(different) if different else 'identical'
+        print(f"workers={workers:<3} {1000 * seconds:9.3f} ms/step  organisms={len(result['organisms'])}"
+              f"  food={len(result['food'])}  {verdict}")
+    return 1 if differences else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,226 @@
+"""
+Benchmarks of the simulation: step throughput, drawing cost and how both scale with the population.
+
+    python -m benchmarks.run --out bench.json
+    python -m benchmarks.run --backend object array --size 50 100 --n 30 100 --steps 200 --out bench.json
+
+(run from the repository root). Three groups of measures are taken:
+
+    step     steps per second and entity updates per second of headless runs, for every combination of
+             --size, --n and --food-density. A step is what the simulation loop does every tick (advance():
+             run_step() plus the day transitions), and its entity updates are the organisms and food items
+             alive when it starts.
+    draw     milliseconds per frame drawn by the Renderer, both from scratch (full) and of the cells changed by
+             one step (incremental), on a hidden window. Skipped when pygame is not installed.
+    scaling  seconds per step for a growing initial population (--scaling-n) on a world of --scaling-size,
+             and the exponent k of time ~ population^k fitted on them, where population is the mean number
+             of organisms during the timed steps (1 means linear).
+
+Every measure is repeated --repeats times on the same seed, and the fastest repeat is kept: the slower ones
+only add the noise of whatever else the machine was doing. Results are written as JSON, to be compared
+between commits with benchmarks/compare.py.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from batch import make_environment, parameter_grid
+from checkpoint import environment_class_for
+
+VERSION = 1
+
+
+def time_steps(env, steps):
+    """
+    Runs steps steps of env.
+
+    Returns:
+        tuple: the seconds they took, and the organisms and food items alive at the start of every step, summed.
+    """
+    organisms = food = 0
+    elapsed = 0.0
+    for _ in range(steps):
+        organisms += len(env.population)
+        food += len(env.food)
+        start = time.perf_counter()
+        env.advance()
+        elapsed += time.perf_counter() - start
+    return elapsed, organisms, food
+
+
+def bench_step(config, backend='object', steps=100, warmup=10, repeats=3, seed=0):
+    best = None
+    for _ in range(repeats):
+        env = make_environment(config, backend, seed)
+        time_steps(env, warmup)
+        measure = time_steps(env, steps)
+        if best is None or measure[0] < best[0]:
+            best = measure
+    elapsed, organisms, food = best
+    return {
+        'benchmark': 'step',
+        'backend': backend,
+        **config,
+        'steps': steps,
+        'seconds': elapsed,
+        'seconds_per_op': elapsed / steps,
+        'steps_per_s': steps / elapsed,
+        'updates_per_s': (organisms + food) / elapsed,
+        'mean_population': organisms / steps,
+        'mean_food': food / steps,
+    }
+
+
+def bench_draw(config, backend='object', frames=50, warmup=5, repeats=3, seed=0, scale=10):
+    """
+    Times Renderer.draw() on a hidden window, from scratch and after a single step.
+
+    Returns:
+        list: one result for 'full' and one for 'incremental' frames, or none if pygame is not available.
+    """
+    try:
+        # No real window: SDL draws on an offscreen surface
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        import pygame
+    except ImportError:
+        return []
+    pygame.init()
+
+    best = {'full': None, 'incremental': None}
+    for _ in range(repeats):
+        env = environment_class_for(backend)(headless=False, seed=seed, scale=scale, **config)
+        renderer = env.renderer
+        for _ in range(warmup):
+            env.advance()
+        renderer.draw()
+
+        timings = {'full': 0.0, 'incremental': 0.0}
+        for _ in range(frames):
+            renderer.full_redraw = True
+            start = time.perf_counter()
+            renderer.draw()
+            timings['full'] += time.perf_counter() - start
+
+            env.advance()
+            start = time.perf_counter()
+            renderer.draw()
+            timings['incremental'] += time.perf_counter() - start
+
+        for mode, elapsed in timings.items():
+            if best[mode] is None or elapsed < best[mode]:
+                best[mode] = elapsed
+
+    return [{
+        'benchmark': 'draw',
+        'mode': mode,
+        'backend': backend,
+        **config,
+        'scale': scale,
+        'frames': frames,
+        'seconds': elapsed,
+        'seconds_per_op': elapsed / frames,
+        'ms_per_frame': 1000 * elapsed / frames,
+    } for mode, elapsed in best.items()]
+
+
+def bench_scaling(ns, size=100, food_density=0.1, backend='object', steps=50, warmup=5, repeats=3, seed=0):
+    """
+    Seconds per step for every initial population in ns.
+
+    Returns:
+        tuple: the results, and the exponent k of seconds per step ~ population^k fitted on them.
+    """
+    results = []
+    for n in ns:
+        result = bench_step({'size': size, 'n': n, 'food_density': food_density}, backend, steps, warmup,
+                            repeats, seed)
+        result['benchmark'] = 'scaling'
+        results.append(result)
+
+    exponent = None
+    if len(results) > 1:
+        population = np.log([result['mean_population'] for result in results])
+        seconds = np.log([result['seconds_per_op'] for result in results])
+        exponent = float(np.polyfit(population, seconds, 1)[0])
+    return results, exponent
+
+
+def git_commit():
+    # Which commit (and whether the tree had uncommitted changes) the numbers belong to
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True)
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                                text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit.stdout.strip(), bool(status.stdout.strip())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark simulation steps and drawing.')
+    parser.add_argument('--backend', choices=['object', 'array'], nargs='+', default=['object', 'array'])
+    parser.add_argument('--size', type=int, nargs='+', default=[50, 100])
+    parser.add_argument('--n', type=int, nargs='+', default=[30, 100])
+    parser.add_argument('--food-density', type=float, nargs='+', default=[0.1])
+    parser.add_argument('--steps', type=int, default=100, help='timed steps per run')
+    parser.add_argument('--frames', type=int, default=50, help='timed frames per run')
+    parser.add_argument('--repeats', type=int, default=3, help='runs per measure, the fastest is kept')
+    parser.add_argument('--scaling-size', type=int, default=100)
+    parser.add_argument('--scaling-n', type=int, nargs='+', default=[25, 50, 100, 200, 400])
+    parser.add_argument('--only', choices=['step', 'draw', 'scaling'], nargs='+',
+                        default=['step', 'draw', 'scaling'])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='bench.json')
+    args = parser.parse_args(argv)
+
+    grid = parameter_grid(size=args.size, n=args.n, food_density=args.food_density)
+    results = []
+    scaling = {}
+    for backend in args.backend:
+        if 'step' in args.only:
+            for config in grid:
+                result = bench_step(config, backend, args.steps, repeats=args.repeats, seed=args.seed)
+                print(f"step     {backend:6} {config}: {result['steps_per_s']:10.1f} steps/s "
+                      f"{result['updates_per_s']:12.0f} updates/s")
+                results.append(result)
+        if 'draw' in args.only:
+            for config in grid:
+                for result in bench_draw(config, backend, args.frames, repeats=args.repeats, seed=args.seed):
+                    print(f"draw     {backend:6} {config} {result['mode']:11}: {result['ms_per_frame']:8.2f} ms/frame")
+                    results.append(result)
+        if 'scaling' in args.only:
+            points, exponent = bench_scaling(args.scaling_n, args.scaling_size, args.food_density[0], backend,
+                                             args.steps, repeats=args.repeats, seed=args.seed)
+            for result in points:
+                print(f"scaling  {backend:6} n={result['n']}: {1000 * result['seconds_per_op']:8.3f} ms/step "
+                      f"with {result['mean_population']:.0f} organisms")
+            if exponent is not None:
+                print(f"scaling  {backend:6} time ~ population^{exponent:.2f}")
+            results += points
+            scaling[backend] = exponent
+
+    commit, dirty = git_commit()
+    report = {
+        'version': VERSION,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'dirty': dirty,
+        'python': platform.python_version(),
+        'machine': platform.platform(),
+        'settings': {name: value for name, value in vars(args).items() if name != 'out'},
+        'scaling_exponent': scaling,
+        'results': results,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+import numpy as np
+
+from food import Food
+from organism import DIRECTIONS, Organism
+
+
+class Columns:
+    """
+    Structure-of-arrays storage: one NumPy array per field instead of one Python object per entity.
+
+    Rows are appended at the end (arrays grow geometrically). Removing a row only clears its alive flag:
+    dead rows are dropped in bulk by keep(), which compacts every column at once.
+    Reading a field (e.g. columns.hp) returns a view on the rows in use.
+    """
+    fields = {}
+
+    def __init__(self, capacity=64):
+        self.count = 0
+        self.data = {name: self.new_column(name, capacity) for name in self.fields}
+
+    def new_column(self, name, capacity):
+        return np.zeros(capacity, dtype=self.fields[name])
+
+    def __getattr__(self, name):
+        data = self.__dict__.get('data')
+        if data is not None and name in data:
+            return data[name][:self.count]
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        # Lets "columns.hp += 1" write back into the column instead of shadowing it
+        data = self.__dict__.get('data')
+        if data is not None and name in data:
+            data[name][:self.count] = value
+        else:
+            object.__setattr__(self, name, value)
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def capacity(self):
+        return len(next(iter(self.data.values())))
+
+    def reserve(self, capacity):
+        if capacity <= self.capacity:
+            return
+        capacity = max(capacity, self.capacity * 2)
+        for name, column in self.data.items():
+            grown = self.new_column(name, capacity)
+            grown[:self.count] = column[:self.count]
+            self.data[name] = grown
+
+    def append(self, n, **values):
+        """
+        Appends n live rows. Fields not given in values are zero.
+
+        Returns:
+            slice: the rows that were just added.
+        """
+        start = self.count
+        self.reserve(start + n)
+        self.count += n
+        # (rows past count may still hold whatever keep() left there)
+        for name, column in self.data.items():
+            column[start:self.count] = values.get(name, 0)
+        self.data['alive'][start:self.count] = True
+        return slice(start, self.count)
+
+    def keep(self, mask):
+        # Drops every row where mask is False, moving the survivors to the front of each column.
+        kept = int(mask.sum())
+        if kept == self.count:
+            return
+        for column in self.data.values():
+            column[:kept] = column[:self.count][mask]
+        self.count = kept
+
+
+class OrganismColumns(Columns):
+    fields = {
+        'x': np.int32,
+        'y': np.int32,
+        'age': np.int32,
+        'hp': np.int32,
+        'hunger': np.int32,
+        'speed': np.int32,
+        'gen': np.int32,
+        'number': np.int32,
+        'direction': np.int8,
+        'pregnant': np.bool_,
+        'steps_pregnant': np.int32,
+        'last_birth': np.int64,
+        'alive': np.bool_,
+    }
+
+
+class FoodColumns(Columns):
+    fields = {
+        'x': np.int32,
+        'y': np.int32,
+        'age': np.int32,
+        'decay': np.int32,
+        'pollinated': np.bool_,
+        'gen': np.int32,
+        'alive': np.bool_,
+    }
+
+
+class EntityView:
+    """
+    A lightweight handle on one row of a Columns storage, so that code written for Organism/Food objects
+    (the renderer, inspection, display_info) keeps working on the array backend.
+
+    A view is only valid until the columns are compacted, that is until the end of the current step.
+    """
+    __slots__ = ('columns', 'row')
+
+    # attribute name on the object backend -> column name
+    aliases = {}
+
+    def __init__(self, columns, row):
+        object.__setattr__(self, 'columns', columns)
+        object.__setattr__(self, 'row', row)
+
+    def __getattr__(self, name):
+        column = self.aliases.get(name, name)
+        if column not in self.columns.data:
+            raise AttributeError(name)
+        return self.columns.data[column][self.row].item()
+
+    def __setattr__(self, name, value):
+        self.columns.data[self.aliases.get(name, name)][self.row] = value
+
+    @property
+    def coord(self):
+        return (self.pos_x, self.pos_y)
+
+
+class OrganismView(EntityView):
+    __slots__ = ()
+    aliases = {'pos_x': 'x', 'pos_y': 'y', 'is_pregnant': 'pregnant', 'total_steps_last_birth': 'last_birth'}
+
+    @property
+    def random_direction(self):
+        return DIRECTIONS[self.direction]
+
+    # The array backend doesn't keep track of ancestors
+    lineage = ()
+
+    sprite = Organism.sprite
+    flipped = Organism.flipped
+    display_info = Organism.display_info
+
+
+class FoodView(EntityView):
+    __slots__ = ()
+    aliases = {'pos_x': 'x', 'pos_y': 'y'}
+
+    food_value = Food.food_value
+    sprite = Food.sprite
+    display_info = Food.display_info
+
+
+class ColumnsSequence:
+    """Read-only sequence of views over a Columns storage: len(), iteration and indexing."""
+    def __init__(self, columns, view):
+        self.columns = columns
+        self.view = view
+
+    def __len__(self):
+        return self.columns.count
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += self.columns.count
+        if not 0 <= row < self.columns.count:
+            raise IndexError(row)
+        return self.view(self.columns, row)
+
+    def __iter__(self):
+        for row in range(self.columns.count):
+            yield self.view(self.columns, row)
@@ -1,105 +1,351 @@
 
-import time
-
-import pygame
-
 from food import Food
-from organism import Organism
-
+from lifecycle import LOOK, ROT, FoodClock, FoodEvents
+from organism import LINEAGE_DEPTH, Organism, Species
+from rng import Streams, new_seed
+from snapshot import FoodSnapshot, WorldSnapshot, occupied_cells
+from spatial import SpatialIndex
+from storage import EntityList
 
-def mstime():
-    return round(time.time() * 1000)
 
 class Environment:
-    def __init__(self, size=1000, food_density=0.10, n=20, regrowth=True, regrowth_rate=5, food_decay=True, screen=None, scale=10, fps=5):
+    def __init__(self, size=1000, food_density=0.10, n=20, regrowth=True, regrowth_rate=5, food_decay=True, screen=None, scale=10, fps=5, headless=False, seed=None,
+                 metrics=None, metrics_every='step', keep_history=True, instrumentation=None, view=None,
+                 replay=None, analytics=None, mutation_rate=0.1, max_speed=4):
         self.size = size
         self.n = n
         self.x = range(0, size)
         self.y = range(0, size)
         self.steps_per_day = 20
         self.default_days = 20
+        self.mutation_rate = mutation_rate
+        self.max_speed = max_speed
+        self.species = Species(self.steps_per_day, mutation_rate, max_speed)
 
         self.food_density = food_density
         self.food_decay = food_decay
         self.regrowth = regrowth
         self.regrowth_rate = regrowth_rate
-        self.food = []
         self.first_time_food = True
 
+        # Every random number comes from generators split from this seed, so a run can be replayed exactly
+        self.seed = new_seed() if seed is None else seed
+        self.streams = self.create_streams()
 
         self.day = 0
         self.steps_today = 0
         self.day_complete = False
         self.total_steps = 0
 
+        # In headless mode there is no window at all: simulate() runs steps as fast as it can,
+        # without polling events, throttling or drawing.
+        self.headless = headless
+
+        # A ReplayRecorder (see replay.py) gets a frame after every step. It is fed the same dirty cells the
+        # renderer would draw, so recording is for headless runs: the two can't share them.
+        if replay is not None and not headless:
+            raise ValueError('replays can only be recorded in headless mode')
+        self.replay = replay
+
+        # Population genetics (see analytics.py), told about every birth and death: None unless we are studying them
+        self.analytics = analytics
+        self.create_storage()
+
         self.sim_fps = fps
         self.scale = scale
-        self.screen = screen
-        if not self.screen:
-            self.screen = pygame.display.set_mode((self.size * self.scale + 400, self.size * self.scale))
 
-        self.population = self.create_population()
-        self.clock = pygame.time.Clock()
+        self.renderer = None
+        if not self.headless:
+            from renderer import Renderer
+            self.renderer = Renderer(self, screen, view)
+
+        self.populate()
         self.end_simulation = False
         self.pause_simulation = False
         self.inspection_mode = False
 
+        # pop_count and food_count grow by one every step: long runs should set keep_history=False and
+        # stream their metrics to a sink instead (see metrics.py), once per step or once per day
+        self.keep_history = keep_history
         self.pop_count = []
         self.food_count = []
+        self.metrics = metrics
+        self.metrics_every = metrics_every
+        self.births = 0
+        self.deaths = 0
 
+        # Per-phase timers, counters and hooks (see instrumentation.py): None unless we are profiling
+        self.instrumentation = instrumentation
 
-        self.info = f"Environment created with {self.size}x{self.size} area and {self.n} organisms.\n" \
-            f"Food density is {self.food_density} and regrowth_rate is {self.regrowth_rate}.\n" \
-            f"Regrowth is set to {self.regrowth} and food_decay is set to {self.food_decay}." \
+        self.info = self.describe()
 
         self.post_init()
 
+        if self.replay is not None:
+            self.replay.record(self)
+        if self.analytics is not None:
+            self.analytics.reset(self)
+
+    def describe(self):
+        return f"Environment created with {self.size}x{self.size} area and {self.n} organisms.\n" \
+            f"Food density is {self.food_density} and regrowth_rate is {self.regrowth_rate}.\n" \
+            f"Regrowth is set to {self.regrowth} and food_decay is set to {self.food_decay}.\n" \
+            f"Random seed is {self.seed}."
+
+    def create_streams(self):
+        return Streams(self.seed)
+
+    def create_storage(self):
+        self.food = EntityList()
+
+        # Cells whose content changed since the last frame, so the renderer only redraws those.
+        # Nobody draws in headless mode, so there we don't even keep track (unless we are recording a replay).
+        self.dirty_cells = None if self.headless and self.replay is None else set()
+
+        # Who is where: kept up to date as entities spawn, move, eat, die and decay
+        self.food_index = SpatialIndex(self.dirty_cells)
+        self.organism_index = SpatialIndex(self.dirty_cells)
+
+        # Food ages without being touched: only its events (growing up, wilting, seeding, rotting) wake it up
+        self.food_clock = FoodClock(self.total_steps, self.food_decay)
+        self.food_events = FoodEvents()
+
+    def populate(self):
+        self.population = EntityList(self.create_population())
+
     def post_init(self):
         initial_food = int(self.size**2 * self.food_density)
         self.add_food_to_env(initial_food)
 
     @property
-    def sidebar(self):
-        return self.size * self.scale + 10
-    
+    def screen(self):
+        return self.renderer.screen if self.renderer else None
+
     def sidebar_info_text(self):
         info_text = ""
         info_text += f"Day: {self.day}\n"
         info_text += f"Steps Today: {self.steps_today}\n"
         info_text += f"Food: {len(self.food)}\n"
         info_text += f"Population: {len(self.population)}\n"
+        if self.instrumentation:
+            info_text += self.instrumentation.sidebar_info_text()
         return info_text
 
     @property
     def food_map(self):
-        return {food.coord: food for food in self.food}
-    
+        return self.food_index
+
     @property
     def organism_map(self):
-        return {organism.coord: organism for organism in self.population}
+        return self.organism_index
+
+    def add_food(self, food):
+        self.food.append(food)
+        self.food_index.add(food)
+        self.food_events.schedule(food, looks=self.dirty_cells is not None)
+
+    def add_food_items(self, foods):
+        # Like add_food for each of them, with all their events queued at once
+        for food in foods:
+            self.food.append(food)
+            self.food_index.add(food)
+        self.food_events.schedule_all(foods, looks=self.dirty_cells is not None)
+
+    def remove_food(self, food):
+        self.food.remove(food)
+        self.food_index.remove(food)
+
+    def add_organism(self, organism):
+        self.population.append(organism)
+        self.organism_index.add(organism)
+        if self.analytics is not None:
+            self.analytics.added((organism.speed,), (organism.gen,), (organism.age,))
+
+    def remove_organism(self, organism):
+        self.population.remove(organism)
+        self.organism_index.remove(organism)
+        if self.analytics is not None:
+            self.analytics.removed((organism.speed,), (organism.gen,), (organism.age,))
+
+    def move_organism(self, organism, old_coord):
+        # Called by organisms after every cell they move
+        self.organism_index.move(organism, old_coord, organism.coord)
+
+    def save_checkpoint(self, path):
+        """
+        Saves the whole state of the simulation to path (see checkpoint.py), so it can be resumed later.
+        """
+        from checkpoint import save_checkpoint
+        save_checkpoint(self, path)
+
+    @classmethod
+    def load_checkpoint(cls, path, **kwargs):
+        """
+        Creates an environment of this class from a checkpoint. See checkpoint.load_checkpoint for kwargs.
+        """
+        from checkpoint import load_checkpoint
+        return load_checkpoint(path, environment_class=cls, **kwargs)
+
+    def entity_columns(self):
+        """
+        Returns:
+            tuple: the organisms and the food, each as a dict of NumPy arrays with one entry per field
+            (the same fields as OrganismColumns and FoodColumns). The organisms also have 'lineage', LINEAGE_DEPTH
+            numbers per organism padded with -1 (numbers are never negative).
+        """
+        import numpy as np
+        from columns import FoodColumns, OrganismColumns
+
+        organisms = {
+            'x': [organism.pos_x for organism in self.population],
+            'y': [organism.pos_y for organism in self.population],
+            'age': [organism.age for organism in self.population],
+            'hp': [organism.hp for organism in self.population],
+            'hunger': [organism.hunger for organism in self.population],
+            'speed': [organism.speed for organism in self.population],
+            'gen': [organism.gen for organism in self.population],
+            'number': [organism.number for organism in self.population],
+            'direction': [organism.direction for organism in self.population],
+            'pregnant': [organism.is_pregnant for organism in self.population],
+            'steps_pregnant': [organism.steps_pregnant for organism in self.population],
+            'last_birth': [organism.total_steps_last_birth for organism in self.population],
+        }
+        food = {
+            'x': [food.pos_x for food in self.food],
+            'y': [food.pos_y for food in self.food],
+            'age': [food.age for food in self.food],
+            'decay': [food.decay for food in self.food],
+            'pollinated': [food.pollinated for food in self.food],
+            'gen': [food.gen for food in self.food],
+        }
+        organisms = {name: np.array(values, dtype=OrganismColumns.fields[name]) for name, values in organisms.items()}
+        food = {name: np.array(values, dtype=FoodColumns.fields[name]) for name, values in food.items()}
+        organisms['lineage'] = np.array([organism.lineage + (-1,) * (LINEAGE_DEPTH - len(organism.lineage))
+                                         for organism in self.population], dtype=np.int32).reshape(-1, LINEAGE_DEPTH)
+        return organisms, food
+
+    def load_entity_columns(self, organisms, food):
+        # Replaces every organism and food item with the ones described by the columns (see entity_columns)
+        self.create_storage()
+        self.population = EntityList()
+        # (checkpoints of the array backend have no lineage)
+        lineages = organisms['lineage'].tolist() if 'lineage' in organisms else None
+        for i in range(len(organisms['x'])):
+            organism = Organism(self, pos_x=int(organisms['x'][i]), pos_y=int(organisms['y'][i]), gen=int(organisms['gen'][i]))
+            organism.age = int(organisms['age'][i])
+            organism.hp = int(organisms['hp'][i])
+            organism.hunger = int(organisms['hunger'][i])
+            organism.speed = int(organisms['speed'][i])
+            organism.number = int(organisms['number'][i])
+            organism.direction = int(organisms['direction'][i])
+            organism.is_pregnant = bool(organisms['pregnant'][i])
+            organism.steps_pregnant = int(organisms['steps_pregnant'][i])
+            organism.total_steps_last_birth = int(organisms['last_birth'][i])
+            if lineages is not None:
+                organism.lineage = tuple(number for number in lineages[i] if number >= 0)
+            self.add_organism(organism)
+
+        for i in range(len(food['x'])):
+            food_item = Food(self, int(food['x'][i]), int(food['y'][i]), gen=int(food['gen'][i]), age=int(food['age'][i]))
+            food_item.decay = int(food['decay'][i])
+            food_item.pollinated = bool(food['pollinated'][i])
+            self.add_food(food_item)
+
+        if self.analytics is not None:
+            # Whoever was loaded is where the counts start from, not a birth
+            self.analytics.reset(self)
+        if self.replay is not None:
+            # What was recorded so far is the empty world we were loaded into
+            self.replay.restart(self)
+
+    def pop_dirty_cells(self):
+        """
+        Returns the cells that changed since the last call, or None if we don't know (so everything has to be redrawn).
+        """
+        if self.dirty_cells is None:
+            return None
+        cells = set(self.dirty_cells)
+        self.dirty_cells.clear()
+        return cells
+
+    def entities_in(self, cells):
+        """
+        Returns:
+            tuple: the organisms and the food items that sit on any of the given cells.
+        """
+        organisms = [organism for cell in cells for organism in self.organism_index.get_all(cell)]
+        food = [food for cell in cells for food in self.food_index.get_all(cell)]
+        return organisms, food
+
+    def entities_in_area(self, x0, y0, x1, y1):
+        """
+        Returns:
+            tuple: the organisms and the food items with x0 <= x < x1 and y0 <= y < y1.
+        """
+        organisms = [organism for organism in self.population
+                     if x0 <= organism.pos_x < x1 and y0 <= organism.pos_y < y1]
+        food = [food for food in self.food if x0 <= food.pos_x < x1 and y0 <= food.pos_y < y1]
+        return organisms, food
+
+    def occupied_cells(self):
+        """
+        Returns:
+            tuple: the x and the y of the cells with organisms on them, then of those with food, as NumPy arrays.
+        """
+        return occupied_cells(self.organism_index.keys(), self.food_index.keys())
+
+    def record_history(self):
+        if self.keep_history:
+            self.pop_count.append(len(self.population))
+            self.food_count.append(len(self.food))
+
+    def hp_moments(self):
+        """
+        Returns:
+            tuple: how many organisms there are, the sum of their hp and the sum of its squares.
+        """
+        hp = [organism.hp for organism in self.population]
+        return len(hp), sum(hp), sum(value * value for value in hp)
+
+    def metrics_record(self):
+        population = self.population
+        n = len(population)
+        return {
+            'step': self.total_steps,
+            'day': self.day,
+            'population': n,
+            'food': len(self.food),
+            'births': self.births,
+            'deaths': self.deaths,
+            'mean_hp': sum(organism.hp for organism in population) / n if n else None,
+            'mean_hunger': sum(organism.hunger for organism in population) / n if n else None,
+            'mean_speed': sum(organism.speed for organism in population) / n if n else None,
+            'mean_gen': sum(organism.gen for organism in population) / n if n else None,
+        }
+
+    def report_metrics(self, day=None):
+        # Births and deaths are counted from one record to the next
+        record = self.metrics_record()
+        if day is not None:
+            # A day record is written once end_day() has moved on to the next day
+            record['day'] = day
+        self.metrics.write(record)
+        self.births = 0
+        self.deaths = 0
 
     def run_step(self):
 
         # print(f'[{self.day + 1}] Running step {self.steps_today + 1}/{self.steps_per_day}...')
         self.steps_today += 1
         self.total_steps += 1
-        self.pop_count.append(len(self.population))
-        self.food_count.append(len(self.food))
-
-        # This is where we check for a pause button, or a stop button, or an inspection button
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                self.end_simulation = True
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_SPACE:
-                    self.pause_simulation = not self.pause_simulation
-                elif event.key == pygame.K_q:
-                        self.end_simulation = True
-                elif event.key == pygame.K_i:
-                        self.inspection_mode = not self.inspection_mode
-
+        self.record_history()
 
+        # With instrumentation, every phase is timed from the end of the previous one
+        probe = self.instrumentation
+        if probe:
+            start = probe.clock()
 
+        species = self.species
         for organism in self.population:
             # You lived another day! Huzzah!
             organism.age += 1
@@ -123,11 +369,17 @@ class Environment:
             if organism.hp > 100:
                 organism.hp = 100
 
-            # If organism has no hp, it dies
+            # If organism has no hp, it dies (and a dead organism doesn't get pregnant or give birth)
             if organism.hp == 0:
-                organism.die()
-            else:
-                organism.move()
+                organism.die(self)
+                continue
+            if probe:
+                start = probe.lap('organisms', start)
+            meals = organism.move(self)
+            if probe:
+                start = probe.lap('movement', start)
+                probe.count('moves', organism.speed)
+                probe.count('meals', meals)
 
             if organism.is_pregnant:
                 organism.steps_pregnant += 1
@@ -135,27 +387,51 @@ class Environment:
             # We check if it's time to become pregnant
             if (
                 not organism.is_pregnant
-                and organism.age > organism.minimum_steps_to_maturity
-                and self.total_steps - organism.total_steps_last_birth > organism.steps_between_births
+                and organism.age > species.minimum_steps_to_maturity
+                and self.total_steps - organism.total_steps_last_birth > species.steps_between_births
 
             ):
-                organism.try_to_become_pregnant()
+                organism.try_to_become_pregnant(self)
 
             # We check if it's time to give birth
             if (
                 organism.is_pregnant
-                and organism.steps_pregnant >= organism.pregancy_duration_steps
+                and organism.steps_pregnant >= species.pregancy_duration_steps
             ):
-                organism.give_birth()
-
-        for food in self.food:
-            food.age += 1
-            if self.food_decay:
-                food.decay -= 1
-                if food.decay == 0:
-                    self.food.remove(food)
-            if food.decay < 6 and not food.pollinated:
-                food.make_children()
+                organism.give_birth(self)
+            if probe:
+                start = probe.lap('births', start)
+
+        if probe:
+            start = probe.lap('organisms', start)
+
+        # Every food item gets one step older, but we only touch those something happens to
+        self.food_clock.step = self.total_steps
+        for kind, food in self.food_events.due(self.total_steps):
+            if food not in self.food:
+                # Somebody ate it first
+                continue
+            if kind == LOOK:
+                # Sprouts growing up and food starting to wilt look different
+                self.dirty_cells.add(food.coord)
+                continue
+            if kind == ROT:
+                self.remove_food(food)
+            # Food about to rot (or rotting) spreads its seeds around
+            if not food.pollinated:
+                seeds = food.make_children(self)
+                if probe:
+                    probe.count('seeds', seeds)
+
+        if probe:
+            start = probe.lap('food', start)
+
+        # Squeeze out the holes left by whoever died, was eaten or rotted away during this step
+        self.population.compact()
+        self.food.compact()
+
+        if probe:
+            probe.lap('compact', start)
 
         if self.steps_today == self.steps_per_day:
             self.day_complete = True
@@ -163,30 +439,27 @@ class Environment:
     def add_food_to_env(self, n=None):
         if not n:
             n = self.regrowth_rate
-        self.food = self.food + self.create_food(n)
+        self.add_food_items(self.create_food(n))
 
     def begin_day(self):
         if self.regrowth:
             self.add_food_to_env()
 
     def draw(self):
-        self.screen.fill((255,255,255))
-        for organism in self.population:
-            organism.draw()
-        for food in self.food:
-            food.draw()
-
-        # We print a little summary on the side of the screen
-        info_text = self.sidebar_info_text()
-        font = pygame.font.SysFont('Consolas', 20)
-        text = font.render(info_text, True, pygame.color.Color('Black'))
-        self.screen.blit(text, (self.size * self.scale + 10, 0))
-
-        pygame.display.flip()
+        if self.renderer:
+            probe = self.instrumentation
+            if probe:
+                start = probe.clock()
+            self.renderer.draw()
+            if probe:
+                probe.lap('draw', start)
 
     def end_day(self):
         # If for whatever reasons there are orgasnism alive with no hp, kill them
-        survivors = [org for org in self.population if org.hp > 0]
+        for org in self.population:
+            if org.hp <= 0:
+                self.remove_organism(org)
+                self.deaths += 1
         # children = [Organism(self, parent=org, gen=org.gen + 1) for org in survivors]
         # reset the hunger of the survivors
         # for survivor in survivors:
@@ -194,17 +467,89 @@ class Environment:
 
         # mutate the children?
         self.day += 1
-        self.population = survivors# + children
         self.steps_today = 0
         self.day_complete = False
 
-    def simulate(self, i:int=None):
+    def advance(self):
+        probe = self.instrumentation
+        births, deaths = self.births, self.deaths
+        # Everybody alive when the step starts gets one step older
+        if self.analytics is not None:
+            self.analytics.aged(len(self.population))
+
+        # This is where all the movements, eating, death and birth happens
+        # This is also where day_complete is set, if conditions are met
+        self.run_step()
+
+        if probe:
+            probe.count('births', self.births - births)
+            probe.count('deaths', self.deaths - deaths)
+            start = probe.clock()
+
+        if self.metrics and self.metrics_every == 'step':
+            self.report_metrics()
+
+        if probe:
+            start = probe.lap('metrics', start)
+
+        # This will stop the cycle of steps for today, end the current day and begin a new day.
+        if self.day_complete:
+            # print()
+            # print(f"Day {gen:02d} complete: {len(self.population)} organisms remain.")
+            # print(f"There are {len(self.food)} food items remaining.")
+            # for organism in self.population:
+            #     print(f"Organism #{organism.number} has {organism.hp} hp and {organism.hunger} hunger.")
+            # print()
+
+
+            # Here we kill, birth and advance the day. This is where we set day_complete to False.
+            deaths, day = self.deaths, self.day
+            self.end_day()
+            day_deaths = self.deaths - deaths
+
+            # The day record goes out after end_day(), so that it has the deaths of the end-of-day sweep too
+            if self.metrics and self.metrics_every == 'day':
+                self.report_metrics(day=day)
+
+            # This is where we add food to the environment, if regrowth is enabled.
+            self.begin_day()
+
+            if self.analytics is not None:
+                self.analytics.end_day(self)
+
+            if probe:
+                probe.count('deaths', day_deaths)
+                probe.lap('day', start)
+                probe.end_day(self)
+
+        if self.replay is not None:
+            if probe:
+                start = probe.clock()
+            self.replay.record(self)
+            if probe:
+                probe.lap('replay', start)
+
+        if probe:
+            probe.end_step(self)
+
+    def snapshot(self):
+        return WorldSnapshot(self)
+
+    def simulate(self, i:int=None, steps_per_frame=1, render_fps=None, threaded=False):
         """
         This will run the simulation for i days. i is inherited from the Environment class, but can be overridden here.
 
+        The simulation and the rendering run at different rates: steps_per_frame steps are simulated for every frame
+        drawn, and frames are drawn at most render_fps times per second. With threaded=True the simulation runs as
+        fast as it can in a worker thread, while this thread draws snapshots of the world at render_fps.
+        In headless mode there is nothing to draw, and steps simply run back to back.
+
         Args:
             i (int, optional): Number of days to simulate. Defaults to None, which will use the default_days value.
-         
+            steps_per_frame (int, optional): Steps simulated between two frames. Defaults to 1.
+            render_fps (int, optional): Maximum frames per second. Defaults to None, which will use sim_fps.
+            threaded (bool, optional): Simulate in a worker thread, decoupled from the frame rate. Defaults to False.
+
         """
         if i is None:
             i = self.default_days
@@ -214,14 +559,34 @@ class Environment:
 
         # print(f'Simulating {i} days...')
 
-        while self.day < i:
+        if not self.renderer:
+            while self.day < i and not self.end_simulation:
+                self.advance()
+        elif threaded:
+            self.simulate_threaded(i, render_fps or self.sim_fps)
+        else:
+            self.simulate_rendered(i, steps_per_frame, render_fps or self.sim_fps)
 
-            # Checks that at least 1/sim_fps seconds have passed from the start of the previous step.
-            # (for example, if sim_fps is 5, we want to wait 200ms between steps)
-            self.time_last_step = mstime()
-            while mstime() < self.time_last_step + (1000 // self.sim_fps):
-                time.sleep(0.01)
+        # Whatever the sink (and the replay) is still holding, we want it on disk now
+        if self.metrics:
+            self.metrics.flush()
+        if self.replay is not None:
+            self.replay.flush()
 
+        # print('Simulation complete.')
+        # print(f'The simulation lasted {self.day} days.')
+
+    def simulate_rendered(self, i, steps_per_frame, render_fps):
+        probe = self.instrumentation
+        while self.day < i:
+
+            if probe:
+                start = probe.clock()
+            self.renderer.handle_events()
+            # Clicks are about what is on screen: they are looked up before the world moves on
+            self.renderer.update_inspection(self)
+            if probe:
+                probe.lap('events', start)
 
             # Here we check if we have, for some reason, to end the simulation
             if self.end_simulation:
@@ -229,113 +594,117 @@ class Environment:
 
             # Here we check if we have to pause the simulation
             if self.pause_simulation:
-                pause_text = pygame.font.SysFont('Consolas', self.size).render('PAUSA', True, pygame.color.Color('Black'))
-                text_width = pause_text.get_width()
-                text_height = pause_text.get_height()
-                self.screen.blit(pause_text,
-                                (int(self.size * self.scale / 2) - int(text_width / 2),
-                                 int(self.size * self.scale / 2) - int(text_height / 2))
-                                 )
-                pygame.display.flip()
-
-                # Mentre siamo in pausa, non succede niente. L'unica cosa che facciamo è
-                # ascoltare eventi, per uscire dalla pausa o dalla simulazione.
-                while self.pause_simulation:
-                    time.sleep(0.1)
-                    for event in pygame.event.get():
-                        if event.type == pygame.QUIT:
-                            self.end_simulation = True
-                        if event.type == pygame.KEYDOWN:
-                            if event.key == pygame.K_SPACE:
-                                self.pause_simulation = not self.pause_simulation
-
-            if self.inspection_mode:
-                pause_text = pygame.font.SysFont('Consolas', 40).render('INSPECTION MODE', True, pygame.color.Color('Black'))
-                text_width = pause_text.get_width()
-                text_height = pause_text.get_height()
-                self.screen.blit(pause_text,
-                                (int(self.size * self.scale / 2) - int(text_width / 2),
-                                 int(self.size * self.scale) - int(text_height))
-                                 )
-                pygame.display.flip()
-
-                while self.inspection_mode:
-                    time.sleep(0.1)
-                    for event in pygame.event.get():
-                        if event.type == pygame.QUIT:
-                            self.end_simulation = True
-                        if event.type == pygame.KEYDOWN and event.key == pygame.K_i:
-                            self.inspection_mode = not self.inspection_mode
-                        if event.type == pygame.MOUSEBUTTONUP:
-                            mouse_pos = pygame.mouse.get_pos()
-
-                            entity = self.get_entity_on_coord(mouse_pos)
-                            if entity:
-                                pygame.draw.rect(self.screen, pygame.color.Color('White'), pygame.Rect(self.size * self.scale + 10, 200,
-                                                                                                       self.size * self.scale + 400, 
-                                                                                                       self.size * self.scale))
-                                info_text = entity.display_info
-                                font = pygame.font.SysFont('Consolas', 20)
-                                text = font.render(info_text, True, pygame.color.Color('Black'))
-                                self.screen.blit(text, (self.size * self.scale + 10, 200))
-                                pygame.display.flip()
-
-
-            # This is where all the movements, eating, death and birth happens
-            # This is also where day_complete is set, if conditions are met
-            self.run_step()
-
-
-            # This will draw the whole frame
-            self.draw()
-
-            # This will stop the cycle of steps for today, end the current day and begin a new day.
-            if self.day_complete:
-                # print()
-                # print(f"Day {gen:02d} complete: {len(self.population)} organisms remain.")
-                # print(f"There are {len(self.food)} food items remaining.")
-                # for organism in self.population:
-                #     print(f"Organism #{organism.number} has {organism.hp} hp and {organism.hunger} hunger.")
-                # print()
-
+                self.renderer.pause()
 
-                # Here we kill, birth and advance the day. This is where we set day_complete to False.
-                self.end_day()
-
-                # This is where we add food to the environment, if regrowth is enabled.
-                self.begin_day()
-                # print(self.pop_count)
-                # print(self.food_count)
-                # print()
+            for _ in range(steps_per_frame):
+                self.advance()
+                if self.day >= i:
+                    break
 
+            # This will draw the whole frame, and wait until it's time for the next one
+            self.draw()
+            self.renderer.wait_frame(render_fps)
+
+    def simulate_threaded(self, i, render_fps):
+        import threading
+
+        # The worker thread owns the world: this thread only takes the lock to grab a snapshot,
+        # or to hold the world still while it's paused or being inspected.
+        lock = threading.Lock()
+        # Whatever goes wrong in the worker thread is raised again here, once it has stopped
+        failure = []
+
+        def worker():
+            try:
+                while self.day < i and not self.end_simulation:
+                    with lock:
+                        self.advance()
+            except BaseException as error:
+                failure.append(error)
+                self.end_simulation = True
 
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        probe = self.instrumentation
+        snapshot = None
+        while thread.is_alive():
+            self.renderer.handle_events()
 
-        # print('Simulation complete.')
-        # print(f'The simulation lasted {self.day} days.')
-        return
+            if self.pause_simulation:
+                with lock:
+                    self.renderer.pause()
+
+            if probe:
+                start = probe.clock()
+            with lock:
+                # Clicks are about the snapshot on screen; what they picked is then followed in the live world, while
+                # it holds still, up to the state the next snapshot shows
+                self.renderer.update_inspection(self, snapshot)
+                snapshot = self.snapshot()
+            self.renderer.draw(snapshot)
+            if probe:
+                # The worker thread is filling in the same timers
+                with lock:
+                    probe.lap('draw', start)
+            self.renderer.wait_frame(render_fps)
+
+        thread.join()
+        if failure:
+            raise failure[0]
+
+    def random_cells(self, n):
+        """
+        Returns:
+            list: n different cells (or every cell, if the world is smaller than that), picked at random in one go.
+        """
+        size = self.size
+        # random.sample picks from a range without building it
+        keys = self.streams.spawn.sample(range(size * size), min(n, size * size))
+        return [divmod(key, size) for key in keys]
 
     def create_population(self):
-        return [Organism(self) for x in range(0, self.n)]
+        # Every organism starts on a cell of its own
+        population = [Organism(self, x, y) for x, y in self.random_cells(self.n)]
+        for organism in population:
+            self.organism_index.add(organism)
+        return population
 
     def get_positions(self):
         return [organism.coord for organism in self.population]
 
     def get_entity_on_coord(self, mouse_pos):
-        coord = (mouse_pos[0] // self.scale, mouse_pos[1] // self.scale)
-        if self.food_map.get(coord):
-            return self.food_map.get(coord)
-        elif self.organism_map.get(coord):
-            return self.organism_map.get(coord)
-        else:
-            return None
+        return self.entity_at((mouse_pos[0] // self.scale, mouse_pos[1] // self.scale))
+
+    def entity_at(self, cell):
+        # What inspection shows for a cell: its food, or else the first organism that got there
+        return self.food_index.get(cell) or self.organism_index.get(cell)
+
+    def follow(self, entity):
+        """
+        Returns entity as it is now, for inspection to show it live, or None once it is gone (dead, eaten, rotten).
+        """
+        return entity if entity in self.population or entity in self.food else None
+
+    def find(self, picked):
+        """
+        Returns the live entity that picked (an OrganismSnapshot or FoodSnapshot, from a frame drawn a few steps ago)
+        was a picture of, or None if it is gone: food by its cell, an organism by its number (the closest one to
+        where it was, should two share the number).
+        """
+        if isinstance(picked, FoodSnapshot):
+            return self.food_index.get(picked.coord)
+        x, y = picked.coord
+        return min((organism for organism in self.population if organism.number == picked.number),
+                   key=lambda organism: abs(organism.pos_x - x) + abs(organism.pos_y - y), default=None)
 
     def create_food(self, n=None):
         if not n:
             n = int((self.size**2 * self.food_density))
         # print(f"Adding {n} food items to the environment...")
         if self.first_time_food:
+            # The initial food is grown up already, and never two items on a cell
             self.first_time_food = False
-            return [Food(self, age=11) for x in range(0, n)]
+            return [Food(self, x, y, age=11) for x, y in self.random_cells(n)]
         else:
             return [Food(self) for x in range(0, n)]
 
@@ -1,30 +1,58 @@
-import random
-import pygame
+from neighbourhood import sample_free_neighbours
+
 
 class Food:
+    # No __dict__ and no reference to the environment: a food item is just these few numbers.
+    # Whatever needs the environment gets it as an argument.
+    # Age and decay are not stored: they follow from the environment's food clock (see lifecycle.py).
+    __slots__ = ('slot', 'pos_x', 'pos_y', 'pollinated', 'gen', 'clock', 'age_base', 'decay_base')
+
     def __init__(self, env, pos_x=None, pos_y=None, decay=40, gen=1, age=0):
-        self.env = env
+        self.slot = None
+        self.clock = env.food_clock
         self.pos_x = pos_x
         self.pos_y = pos_y
-        self.decay = random.randint(decay, decay*3)
+        self.decay = env.streams.food.randint(decay, decay*3)
         self.pollinated = False
         self.gen = gen
         self.age = age
 
 
-        if not pos_x:
-            self.pos_x = random.choice(self.env.x)
-        if not pos_y:
-            self.pos_y = random.choice(self.env.y)
+        if pos_x is None:
+            self.pos_x = env.streams.spawn.choice(env.x)
+        if pos_y is None:
+            self.pos_y = env.streams.spawn.choice(env.y)
 
-        self.coord = (self.pos_x, self.pos_y)
+    @property
+    def coord(self):
+        return (self.pos_x, self.pos_y)
 
+    @property
+    def age(self):
+        return self.age_base + self.clock.step
+
+    @age.setter
+    def age(self, age):
+        self.age_base = age - self.clock.step
+
+    @property
+    def decay(self):
+        if self.clock.decay:
+            return self.decay_base - self.clock.step
+        return self.decay_base
+
+    @decay.setter
+    def decay(self, decay):
+        if self.clock.decay:
+            decay += self.clock.step
+        self.decay_base = decay
 
     def food_value(self):
         return 20 if self.age > 10 else 5
 
-    def image(self):
-        return pygame.image.load(f'res/{self.env.scale}/food.png') if self.age > 10 else pygame.image.load(f'res/{self.env.scale}/sprout.png')
+    @property
+    def sprite(self):
+        return 'food' if self.age > 10 else 'sprout'
 
     @property
     def display_info(self):
@@ -32,35 +60,16 @@ class Food:
                 f"Gen  : {self.gen}\n" \
                 f"Age  : {self.age}\n" \
                 f"Value: {self.food_value()}\n" \
-                f"Decay: {self.decay}\n" 
-
-    def select_random_neighbors(self, coords, n, radius):
-        x, y = coords
-        neighbors = []
-        while len(neighbors) < n:
-            dx, dy = random.choice([(i, j) for i in range(-radius, radius+1) for j in range(-radius, radius+1) if (i, j) != (0, 0)])
-            new_x, new_y = x + dx, y + dy
-            if 0 <= new_x <= self.env.size and 0 <= new_y <= self.env.size:
-                neighbors.append((new_x, new_y))
-        return neighbors
-
-
-    def make_children(self):
+                f"Decay: {self.decay}\n"
 
+    def make_children(self, env):
+        # Returns how many seeds actually took root
         self.pollinated = True
-        n_seeds = random.choice(range(0, 4))
-        for neighboor in self.select_random_neighbors(self.coord, n_seeds, 2):
-            if neighboor not in self.env.food_map.keys():
-                new_food = Food(self.env, neighboor[0], neighboor[1], gen=self.gen + 1)
-                new_food.draw()
-                self.env.food.append(new_food)
-
-    def draw(self):
-        image = self.image()
-        self.colorImage = pygame.Surface(image.get_size()).convert_alpha()
-        self.color = (0, 255, 0)
-        if self.decay < 10:
-            self.color = (115, 130, 100)
-        self.colorImage.fill(self.color)
-        image.blit(self.colorImage, (0,0), special_flags = pygame.BLEND_RGBA_MULT)
-        self.env.screen.blit(image, (self.coord[0] * self.env.scale, self.coord[1] * self.env.scale))
+        planted = 0
+        n_seeds = env.streams.food.choice(range(0, 4))
+        # Seeds only take root on free cells within two steps
+        for neighboor in sample_free_neighbours(env.streams.food, self.coord, n_seeds, 2, env.size, env.food_index):
+            new_food = Food(env, neighboor[0], neighboor[1], gen=self.gen + 1)
+            env.add_food(new_food)
+            planted += 1
+        return planted
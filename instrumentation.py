@@ -0,0 +1,93 @@
+import time
+
+# The phases of a step (and of a frame) that get their own timer, in the order they happen
+PHASES = ['events', 'organisms', 'movement', 'births', 'food', 'compact', 'metrics', 'day', 'replay', 'draw']
+COUNTERS = ['moves', 'meals', 'births', 'deaths', 'seeds']
+
+
+class Instrumentation:
+    """
+    Opt-in timers and counters for the phases of a simulation, for when a world gets slow and we want to know why.
+
+    Give one to an environment (Environment(..., instrumentation=Instrumentation())) and it will time every
+    phase of every step, count what happened in it (cells moved, meals, births, deaths, seeds planted) and call
+    the hooks registered with on(). Without one, the environment only pays for a few `if` checks.
+
+    Hooks:
+        'step': called after every step as hook(env, seconds, counters), with this step's seconds per phase
+            and counters (both dicts, reused from one step to the next: copy them to keep them).
+        'day': called after every day transition as hook(env).
+    """
+    clock = staticmethod(time.perf_counter)
+
+    def __init__(self):
+        self.hooks = {'step': [], 'day': []}
+        self.reset()
+
+    def reset(self):
+        self.steps = 0
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.step_seconds = dict.fromkeys(PHASES, 0.0)
+        self.step_counters = dict.fromkeys(COUNTERS, 0)
+
+    def on(self, event, hook):
+        self.hooks[event].append(hook)
+        return hook
+
+    def lap(self, phase, start):
+        """
+        Adds the time since start to phase, and returns the current time so the next phase can start from it.
+        """
+        now = time.perf_counter()
+        self.step_seconds[phase] += now - start
+        return now
+
+    def count(self, counter, value=1):
+        self.step_counters[counter] += value
+
+    def end_step(self, env):
+        self.steps += 1
+        for phase, seconds in self.step_seconds.items():
+            self.seconds[phase] += seconds
+        for counter, value in self.step_counters.items():
+            self.counters[counter] += value
+        for hook in self.hooks['step']:
+            hook(env, self.step_seconds, self.step_counters)
+        for phase in self.step_seconds:
+            self.step_seconds[phase] = 0.0
+        for counter in self.step_counters:
+            self.step_counters[counter] = 0
+
+    def end_day(self, env):
+        for hook in self.hooks['day']:
+            hook(env)
+
+    def report(self):
+        """
+        Returns:
+            dict: the steps run, and for every phase its total seconds, milliseconds per step and share of the
+            total time; for every counter its total and its mean per step.
+        """
+        total = sum(self.seconds.values())
+        steps = self.steps or 1
+        return {
+            'steps': self.steps,
+            'seconds': total,
+            'phases': {phase: {'seconds': seconds,
+                               'ms_per_step': 1000 * seconds / steps,
+                               'share': seconds / total if total else 0.0}
+                       for phase, seconds in self.seconds.items()},
+            'counters': {counter: {'total': value, 'per_step': value / steps}
+                         for counter, value in self.counters.items()},
+        }
+
+    def sidebar_info_text(self):
+        steps = self.steps or 1
+        info_text = "ms/step\n"
+        for phase, seconds in self.seconds.items():
+            info_text += f"  {phase:<9} {1000 * seconds / steps:7.3f}\n"
+        info_text += "per step\n"
+        for counter, value in self.counters.items():
+            info_text += f"  {counter:<9} {value / steps:7.2f}\n"
+        return info_text
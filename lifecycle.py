@@ -0,0 +1,92 @@
+import heapq
+import itertools
+
+# What can happen to a food item, in the order it happens within a step
+ROT, LOOK, SEED = range(3)
+
+
+class FoodClock:
+    """
+    The last step whose food events have run, shared by all the food of an environment.
+
+    Food doesn't tick: its age and decay are worked out from this clock when somebody asks for them.
+    """
+    __slots__ = ('step', 'decay')
+
+    def __init__(self, step=0, decay=True):
+        self.step = step
+        self.decay = decay
+
+
+class FoodEvents:
+    """
+    A priority queue of what is going to happen to every food item, and when: it rots (decay reaches 0),
+    it looks different (a sprout grows up at age 11, food starts to wilt at decay 9) and it spreads its
+    seeds (decay drops below 6).
+
+    Each of these can be predicted when the item is added, so a step only wakes the items something
+    happens to. Within a step, items wake up in the order they were added, like they did when the food
+    loop went through all of them.
+    """
+    def __init__(self):
+        self.heap = []
+        self.order = itertools.count()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def clear(self):
+        self.heap.clear()
+
+    def events(self, food, looks):
+        # The events of food that fall after its clock's current step, as heap entries. Since age and decay follow
+        # the clock (see Food), the step something happens at only depends on age_base and decay_base.
+        clock = food.clock
+        now = clock.step
+        grown = 11 - food.age_base
+        decay_base = food.decay_base
+        order = next(self.order)
+        events = []
+        if looks and grown > now:
+            events.append((grown, order, LOOK, food))
+        if clock.decay:
+            # (a sprout could grow up the very step it starts to wilt: one LOOK is enough)
+            if looks and decay_base - 9 > now and decay_base - 9 != grown:
+                events.append((decay_base - 9, order, LOOK, food))
+            if decay_base > now:
+                events.append((decay_base, order, ROT, food))
+            if not food.pollinated:
+                events.append((decay_base - 5 if decay_base - 6 > now else now + 1, order, SEED, food))
+        elif decay_base < 6 and not food.pollinated:
+            events.append((now + 1, order, SEED, food))
+        return events
+
+    def schedule(self, food, looks=True):
+        """
+        Queues the events of food (a new item). LOOK events are only needed when somebody draws the world.
+        """
+        for event in self.events(food, looks):
+            heapq.heappush(self.heap, event)
+
+    def schedule_all(self, foods, looks=True):
+        """
+        Like schedule for each of foods, in order. A big batch (the initial food of a world) is heapified in one
+        go instead of pushed one event at a time.
+        """
+        events = [event for food in foods for event in self.events(food, looks)]
+        if len(events) * 4 < len(self.heap):
+            for event in events:
+                heapq.heappush(self.heap, event)
+        else:
+            self.heap += events
+            heapq.heapify(self.heap)
+
+    def due(self, step):
+        """
+        Yields (kind, food) for every event up to step, in order. Events scheduled meanwhile for later steps
+        wait for their turn.
+        """
+        heap = self.heap
+        while heap and heap[0][0] <= step:
+            _, _, kind, food = heapq.heappop(heap)
+            yield kind, food
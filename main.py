@@ -1,6 +1,7 @@
-import pygame
+import csv
+
 from env import Environment
-import matplotlib.pyplot as plt
+from metrics import CSVMetricsSink
 
 
 
@@ -16,17 +17,38 @@ FOOD_DENSITY = 0.1
 # This is the sprite default size, and used to convert simulation cells coordinate in the pixel grid
 SCALE_FACTOR = 20
 
-pygame.init()
+# Without a window the simulation runs as fast as it can: no event polling, no frame pacing, no drawing
+HEADLESS = False
+
+# Simulation steps for every frame drawn: raise it to watch long runs without slowing them down to the frame rate
+STEPS_PER_FRAME = 1
+
+# Population and food of every step go to this file as the simulation runs, instead of piling up in memory
+METRICS_PATH = 'metrics.csv'
 
-env = Environment(size=SIZE, scale=SCALE_FACTOR, food_density=FOOD_DENSITY, n=N, fps=100)
+if not HEADLESS:
+    import pygame
+    pygame.init()
+
+metrics = CSVMetricsSink(METRICS_PATH)
+env = Environment(size=SIZE, scale=SCALE_FACTOR, food_density=FOOD_DENSITY, n=N, fps=100, headless=HEADLESS,
+                  metrics=metrics, keep_history=False)
 
 print(env.info)
 
 # This is blocking - with i= 0, it will run forever
-env.simulate(i=0) 
+env.simulate(i=0, steps_per_frame=STEPS_PER_FRAME)
+
+metrics.close()
 
-food = env.food_count
-population = env.pop_count
+food, population = [], []
+with open(METRICS_PATH, newline='') as f:
+    for record in csv.DictReader(f):
+        food.append(int(record['food']))
+        population.append(int(record['population']))
+
+# matplotlib takes a while to import, and we only need it now that the run is over
+import matplotlib.pyplot as plt
 
 # create a simple matplotlib graph with two lines for food and population
 fig, ax = plt.subplots()
@@ -0,0 +1,87 @@
+import csv
+import os
+
+FIELDS = ['step', 'day', 'population', 'food', 'births', 'deaths', 'mean_hp', 'mean_hunger', 'mean_speed', 'mean_gen']
+
+
+class MetricsSink:
+    """
+    Receives the metrics of a running simulation, one record (a dict with FIELDS as keys) at a time.
+
+    An environment with a sink sends it a record every step (or every day, see Environment's metrics_every),
+    so long runs can be followed while they execute without keeping the whole history in memory.
+    """
+    def write(self, record):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class MemoryMetricsSink(MetricsSink):
+    """Keeps every record in a list. Handy for short runs and for tests, not for endless ones."""
+    def __init__(self):
+        self.records = []
+
+    def write(self, record):
+        self.records.append(record)
+
+
+class CSVMetricsSink(MetricsSink):
+    """
+    Writes records to CSV files, buffering buffer_size records between writes.
+
+    With rotate_every, a new file is started every rotate_every records: metrics.csv becomes metrics.0000.csv,
+    metrics.0001.csv and so on, each with its own header, so finished chunks can be read (or moved away)
+    while the simulation keeps going.
+    """
+    def __init__(self, path, buffer_size=1000, rotate_every=None):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.rotate_every = rotate_every
+        self.buffer = []
+        self.part = 0
+        self.rows_in_file = 0
+        self.file = None
+        self.writer = None
+
+    def file_path(self):
+        if not self.rotate_every:
+            return self.path
+        # (only the file name has an extension: directories may have dots in their names too)
+        stem, extension = os.path.splitext(self.path)
+        return f'{stem}.{self.part:04d}{extension or ".csv"}'
+
+    def open_file(self):
+        self.file = open(self.file_path(), 'w', newline='')
+        self.writer = csv.DictWriter(self.file, fieldnames=FIELDS, extrasaction='ignore')
+        self.writer.writeheader()
+        self.rows_in_file = 0
+
+    def write(self, record):
+        self.buffer.append(record)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        for record in self.buffer:
+            if self.file is None:
+                self.open_file()
+            self.writer.writerow(record)
+            self.rows_in_file += 1
+            if self.rotate_every and self.rows_in_file >= self.rotate_every:
+                self.file.close()
+                self.file = None
+                self.part += 1
+        self.buffer.clear()
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
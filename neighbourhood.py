@@ -0,0 +1,49 @@
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def offsets(radius):
+    """
+    Every (dx, dy) within radius of a cell (a square, not a circle), the cell itself excluded.
+    Computed once per radius.
+    """
+    return tuple((i, j) for i in range(-radius, radius + 1) for j in range(-radius, radius + 1) if (i, j) != (0, 0))
+
+
+def free_neighbours(coord, radius, size, occupied=()):
+    """
+    The cells within radius of coord that are inside the world (0 <= x, y < size) and not in occupied
+    (anything supporting `in`, e.g. a SpatialIndex).
+    """
+    x, y = coord
+    cells = []
+    for dx, dy in offsets(radius):
+        cell = (x + dx, y + dy)
+        if 0 <= cell[0] < size and 0 <= cell[1] < size and cell not in occupied:
+            cells.append(cell)
+    return cells
+
+
+def sample_free_neighbours(rng, coord, n, radius, size, occupied=()):
+    """
+    Up to n different cells, picked at random among the free neighbours of coord (see free_neighbours).
+
+    The cost only depends on radius, never on luck: near an edge or in a crowd there are simply fewer
+    cells to pick from, and fewer than n may come back.
+
+    Args:
+        rng (random.Random): The stream the picks are drawn from.
+        coord (tuple): The cell in the middle.
+        n (int): How many cells we would like.
+        radius (int): How far from coord they can be.
+        size (int): The side of the world.
+        occupied (optional): Cells that can't be picked. Defaults to none.
+
+    Returns:
+        list: the picked cells.
+    """
+    cells = free_neighbours(coord, radius, size, occupied)
+    if n >= len(cells):
+        rng.shuffle(cells)
+        return cells
+    return rng.sample(cells, n)
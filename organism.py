@@ -1,163 +1,178 @@
-import random
-import pygame
 from food import Food
+from neighbourhood import sample_free_neighbours
+
+# (dx, dy) for each direction. Organisms store the index of their direction in this table.
+STEPS = {'up': (0, 1), 'down': (0, -1), 'left': (-1, 0), 'right': (1, 0)}
+DIRECTIONS = list(STEPS)
+DELTAS = list(STEPS.values())
+RIGHT = DIRECTIONS.index('right')
+
+# How many ancestors an organism remembers (see Organism.lineage)
+LINEAGE_DEPTH = 5
+
+
+class Species:
+    """
+    What is the same for every organism of a world: how long it takes to grow up, to carry a baby,
+    and to be ready for the next one, and how traits are passed on. The environment keeps one, instead of
+    every organism keeping a copy.
+
+    Babies get their mother's speed. With probability mutation_rate it mutates to one more or one less,
+    always between 1 and max_speed.
+    """
+    __slots__ = ('minimum_steps_to_maturity', 'pregancy_duration_steps', 'steps_between_births',
+                 'mutation_rate', 'max_speed')
+
+    def __init__(self, steps_per_day, mutation_rate=0.1, max_speed=4):
+        self.minimum_steps_to_maturity = 5 * steps_per_day
+        self.pregancy_duration_steps = 2 * steps_per_day
+        self.steps_between_births = 2 * steps_per_day
+        self.mutation_rate = mutation_rate
+        self.max_speed = max_speed
+
+    def inherit_speed(self, speed, rng):
+        if rng.random() < self.mutation_rate:
+            speed += rng.choice((-1, 1))
+        return min(max(speed, 1), self.max_speed)
+
 
 class Organism:
-    def __init__(self, env, pos_x=None, pos_y=None, gen=0):
+    # No __dict__ and no reference to the environment: an organism is just these few numbers.
+    # Whatever needs the environment gets it as an argument.
+    __slots__ = ('slot', 'age', 'gen', 'number', 'pos_x', 'pos_y', 'hp', 'hunger', 'speed',
+                 'is_pregnant', 'steps_pregnant', 'total_steps_last_birth', 'direction', 'lineage')
+
+    def __init__(self, env, pos_x=None, pos_y=None, gen=0, speed=None):
 
-        self.env = env
+        self.slot = None
         self.age = 0
-        self._flipped = False
         self.gen = gen
-        self.number = random.choice(range(0, 1000000))
+        self.number = env.streams.spawn.choice(range(0, 1000000))
 
         self.pos_x = pos_x
         self.pos_y = pos_y
 
-        
-        if not pos_x:
-            self.pos_x = random.choice(self.env.x)
-        if not pos_y:
-            self.pos_y = random.choice(self.env.y)
 
-        self.coord = (self.pos_x, self.pos_y)
+        if pos_x is None:
+            self.pos_x = env.streams.spawn.choice(env.x)
+        if pos_y is None:
+            self.pos_y = env.streams.spawn.choice(env.y)
 
         self.hp = 100
         self.hunger = 100
-        self.speed = random.choice(range(1, 3))
+        self.speed = speed
+        if speed is None:
+            self.speed = min(env.streams.spawn.choice(range(1, 3)), env.species.max_speed)
 
-        self.minimum_steps_to_maturity = 5 * self.env.steps_per_day
-        self.pregancy_duration_steps = 2 * self.env.steps_per_day
         self.is_pregnant = False
         self.steps_pregnant = 0
         self.total_steps_last_birth = 0
-        self.steps_between_births = 2 * self.env.steps_per_day
 
-        self.target = None
-        self.random_direction = random.choice(['up', 'down', 'left', 'right'])
+        self.direction = env.streams.move.randrange(4)
 
+        # The numbers of the mother, the grandmother and so on, up to LINEAGE_DEPTH of them
+        self.lineage = ()
 
-    def select_random_neighbors(self, coords, n, radius):
-        x, y = coords
-        neighbors = []
-        while len(neighbors) < n:
-            dx, dy = random.choice([(i, j) for i in range(-radius, radius+1) for j in range(-radius, radius+1) if (i, j) != (0, 0)])
-            new_x, new_y = x + dx, y + dy
-            if 0 <= new_x <= self.env.size and 0 <= new_y <= self.env.size:
-                neighbors.append((new_x, new_y))
-        return neighbors
+    @property
+    def coord(self):
+        return (self.pos_x, self.pos_y)
+
+    @property
+    def random_direction(self):
+        return DIRECTIONS[self.direction]
+
+    @random_direction.setter
+    def random_direction(self, name):
+        self.direction = DIRECTIONS.index(name)
 
-    def try_to_become_pregnant(self):
-        if random.randint(0, 10) < 2:
+    def try_to_become_pregnant(self, env):
+        if env.streams.breed.randint(0, 10) < 2:
             self.is_pregnant = True
             self.steps_pregnant = 0
         return
 
-    def give_birth(self):
+    def give_birth(self, env):
         self.is_pregnant = False
-        self.total_steps_last_birth = self.env.total_steps
+        self.total_steps_last_birth = env.total_steps
         self.steps_pregnant = 0
         if self.hp > 50:
             self.hp -= 30
-            n_children = random.choice(range(1, 2))
+            n_children = env.streams.breed.choice(range(1, 2))
             next_gen = self.gen + 1
-            for neighboor in self.select_random_neighbors(self.coord, n_children, 1):
-                if neighboor not in self.env.organism_map.keys():
-
-                    new_baby = Organism(self.env, pos_x=neighboor[0], pos_y=neighboor[1], gen=next_gen)
-                    new_baby.draw()
-                    self.env.population.append(new_baby)
+            # Babies are born on free cells next to their mother (if there's none, no baby)
+            for neighboor in sample_free_neighbours(env.streams.breed, self.coord, n_children, 1, env.size, env.organism_index):
+                speed = env.species.inherit_speed(self.speed, env.streams.breed)
+                new_baby = Organism(env, pos_x=neighboor[0], pos_y=neighboor[1], gen=next_gen, speed=speed)
+                new_baby.lineage = (self.number,) + self.lineage[:LINEAGE_DEPTH - 1]
+                env.add_organism(new_baby)
+                env.births += 1
         else:
             self.hp -= 10 # This is like an abortion
-            new_food = Food(self.env, self.coord[0], self.coord[1])
-            new_food.draw()
-            self.env.food.append(new_food)
+            new_food = Food(env, self.pos_x, self.pos_y)
+            env.add_food(new_food)
 
 
         return
 
-    def image(self):
+    @property
+    def sprite(self):
         if self.is_pregnant:
-            image = pygame.image.load(f'res/{self.env.scale}/pregnant.png')
+            return 'pregnant'
         elif self.age > 10:
-            image = pygame.image.load(f'res/{self.env.scale}/organism.png')
+            return 'organism'
         else:
-            image = pygame.image.load(f'res/{self.env.scale}/baby.png')
-
-        if self.random_direction == 'right' and not self._flipped:
-            return pygame.transform.flip(image, True, False)
-        elif self.random_direction == 'left' and self._flipped:
-            self._flipped = False
-            return pygame.transform.flip(image, True, False)
-        
-        else:
-            if self._flipped:
-                return pygame.transform.flip(image, True, False)
-            else:
-                return image
+            return 'baby'
 
+    @property
+    def flipped(self):
+        return self.direction == RIGHT
 
     @property
     def display_info(self):
         info = ""
-        info += f"Type    : {type(self).__name__}\n" 
-        info += f"Number  : # {self.number}\n" 
-        info += f"HP      : {self.hp}\n" 
-        info += f"Hunger  : {self.hunger}\n" 
-        info += f"Speed   : {self.speed}\n" 
+        info += f"Type    : {type(self).__name__}\n"
+        info += f"Number  : # {self.number}\n"
+        info += f"HP      : {self.hp}\n"
+        info += f"Hunger  : {self.hunger}\n"
+        info += f"Speed   : {self.speed}\n"
         info += f"Gen     : {self.gen}\n"
+        if self.lineage:
+            info += f"Lineage : {' < '.join(f'#{number}' for number in self.lineage)}\n"
         info += f"Age     : {self.age}\n"
         info += f"Pregnant: {self.is_pregnant}\n"
         if self.is_pregnant:
             info += f"Steps pregnant: {self.steps_pregnant}\n"
         return info
 
-    def eat(self):
-        if self.coord in self.env.food_map.keys():
-            food_piece = self.env.food_map[self.coord]
+    def eat(self, env):
+        food_piece = env.food_index.get((self.pos_x, self.pos_y))
+        if food_piece:
             self.hunger += food_piece.food_value()
-            self.env.food.remove(food_piece)
-            # for food in self.env.food:
-            #     if food.coord == self.coord:
-            #         self.env.food.remove(food)
+            env.remove_food(food_piece)
             if self.hunger > 100:
                 self.hunger = 100
+            return True
+        return False
 
-    def move(self):
+    def move(self, env):
+        # Returns how many times it ate on the way
+        move = env.streams.move
+        meals = 0
         for _ in range(0, self.speed):
-            if self.random_direction == 'up':
-                self.pos_y += 1
-            elif self.random_direction == 'down':
-                self.pos_y -= 1
-            elif self.random_direction == 'left':
-                self.pos_x -= 1
-            elif self.random_direction == 'right':
-                self.pos_x += 1
-
-            if self.pos_x < 0:
-                self.pos_x = self.env.size
-            elif self.pos_x > self.env.size:
-                self.pos_x = 0
-
-            if self.pos_y < 0:
-                self.pos_y = self.env.size
-            elif self.pos_y > self.env.size:
-                self.pos_y = 0
-
-            self.random_direction = random.choice(['up', 'down', 'left', 'right'])
-            self.coord = (self.pos_x, self.pos_y)
-            self.eat()
-
-    def die(self):
-        self.env.population.remove(self)
-        self.env.food.append(Food(self.env, pos_x=self.pos_x, pos_y=self.pos_y))
+            dx, dy = DELTAS[self.direction]
+            old_coord = (self.pos_x, self.pos_y)
+
+            # The world wraps around: walking off one edge brings you back on the opposite one
+            self.pos_x = (self.pos_x + dx) % env.size
+            self.pos_y = (self.pos_y + dy) % env.size
+
+            self.direction = move.randrange(4)
+            env.move_organism(self, old_coord)
+            meals += self.eat(env)
+        return meals
+
+    def die(self, env):
+        env.remove_organism(self)
+        env.deaths += 1
+        env.add_food(Food(env, pos_x=self.pos_x, pos_y=self.pos_y))
         # print(f"Organism {self.number} has died. - Gen: {self.gen} Speed: {self.speed}")
-        del self
-
-    def draw(self):
-        image = self.image()
-        self.colorImage = pygame.Surface(image.get_size()).convert_alpha()
-        self.color = (int(255 / 100 * self.hp if self.hp > 0 else 0), 0, 0)
-        self.colorImage.fill(self.color)
-        image.blit(self.colorImage, (0,0), special_flags = pygame.BLEND_RGBA_MULT)
-        self.env.screen.blit(image, (self.coord[0] * self.env.scale, self.coord[1] * self.env.scale))
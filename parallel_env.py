@@ -0,0 +1,316 @@
+"""
+Parallel stepping of one world: ParallelArrayEnvironment spreads the bulk of every step of an ArrayEnvironment
+over worker processes that share its columns through shared memory.
+"""
+import os
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from array_env import ArrayEnvironment, move_rows, update_food_part, update_organisms_part
+from columns import FoodColumns, OrganismColumns
+from rng import derive_seed
+
+
+class SharedBlocks:
+    """
+    The shared memory blocks behind the arrays of an environment. Workers attach to them by name.
+    Blocks are unlinked when freed, or when their owner goes away.
+    """
+    def __init__(self):
+        self.blocks = {}
+        self.retired = []
+        self.finalizer = weakref.finalize(self, SharedBlocks.release, self.blocks, self.retired)
+
+    def array(self, shape, dtype):
+        """
+        Returns:
+            tuple: a new zeroed array of the given shape and dtype, and the name of its block.
+        """
+        size = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        block = SharedMemory(create=True, size=size)
+        self.blocks[block.name] = block
+        array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        array.fill(0)
+        return array, block.name
+
+    def free(self, name):
+        block = self.blocks.pop(name)
+        block.unlink()
+        # The block can only be closed once no array uses it anymore: until then we try again at every free()
+        self.retired.append(block)
+        self.retired[:] = [block for block in self.retired if not SharedBlocks.close(block)]
+
+    @staticmethod
+    def close(block):
+        try:
+            block.close()
+            return True
+        except BufferError:
+            return False
+
+    @staticmethod
+    def release(blocks, retired):
+        for block in blocks.values():
+            try:
+                block.unlink()
+            except FileNotFoundError:
+                pass
+            SharedBlocks.close(block)
+        for block in retired:
+            SharedBlocks.close(block)
+        blocks.clear()
+
+
+class SharedColumns:
+    # Columns (see columns.py) allocated in shared memory blocks
+    def __init__(self, blocks, capacity=64):
+        self.blocks = blocks
+        self.names = {}
+        super().__init__(capacity)
+
+    def new_column(self, name, capacity):
+        column, block = self.blocks.array(capacity, self.fields[name])
+        self.names[name] = block
+        return column
+
+    def reserve(self, capacity):
+        # The old blocks are freed only once reserve() has copied them into the new ones
+        old = dict(self.names)
+        super().reserve(capacity)
+        for name, block in old.items():
+            if self.names[name] != block:
+                self.blocks.free(block)
+
+    def layout(self):
+        return {'count': self.count, 'capacity': self.capacity,
+                'columns': {name: (block, np.dtype(self.fields[name]).str) for name, block in self.names.items()}}
+
+    def free(self):
+        for block in self.names.values():
+            self.blocks.free(block)
+        self.names.clear()
+
+
+class SharedOrganismColumns(SharedColumns, OrganismColumns):
+    pass
+
+
+class SharedFoodColumns(SharedColumns, FoodColumns):
+    pass
+
+
+# What follows runs in the worker processes. Each task gets the layout of the shared arrays (block names,
+# dtypes and sizes), works on its own range of rows, and writes only to those rows: anything that touches
+# other rows or needs a random stream goes back to the main process, which reconciles it.
+# The same functions run in the main process, on its own arrays, when a world is too small to split.
+# The rules themselves (update_organisms_part, move_rows, update_food_part) are ArrayEnvironment's.
+
+_attached = {}
+
+
+def in_worker(function, layout, *args):
+    return function(attach(layout), *args)
+
+
+def attach(layout):
+    names = {block for part in ('organisms', 'foods') for block, _ in layout[part]['columns'].values()}
+    names.add(layout['food_grid'])
+    # Blocks the main process has replaced since the last task are not needed anymore
+    for name in list(_attached):
+        if name not in names and SharedBlocks.close(_attached[name]):
+            del _attached[name]
+
+    def column(name, dtype, shape):
+        block = _attached.get(name)
+        if block is None:
+            block = _attached[name] = SharedMemory(name=name)
+        return np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+    arrays = {}
+    for part in ('organisms', 'foods'):
+        count, capacity = layout[part]['count'], layout[part]['capacity']
+        arrays[part] = {field: column(name, dtype, capacity)[:count]
+                        for field, (name, dtype) in layout[part]['columns'].items()}
+    size = layout['size']
+    arrays['food_grid'] = column(layout['food_grid'], np.int32, (size, size))
+    return arrays
+
+
+def move_part(arrays, start, stop, step, key, track_dirty):
+    """
+    Moves the organisms in rows [start, stop) that still have moves left at sub-step step.
+
+    Directions are drawn from a counter-based generator keyed by key, one number per row, so every row gets
+    the same number whichever worker moves it.
+
+    Returns:
+        tuple: the rows that moved, those that landed on food with the food rows they landed on (who gets
+        to eat is decided by the main process), and the cells to redraw (or None).
+    """
+    o = arrays['organisms']
+    size = len(arrays['food_grid'])
+    movers = np.flatnonzero(o['alive'][start:stop] & (o['speed'][start:stop] > step)) + start
+    x, y, direction = o['x'], o['y'], o['direction']
+
+    dirty = None
+    if track_dirty:
+        dirty = [x[movers].astype(np.int64) * size + y[movers]]
+    eaters, food_rows = move_rows(arrays, movers)
+    if track_dirty:
+        dirty.append(x[movers].astype(np.int64) * size + y[movers])
+        dirty = np.concatenate(dirty)
+
+    # Philox makes four numbers per step of its counter: skip to the one of row start
+    generator = np.random.Philox(key=key)
+    generator.advance(start // 4)
+    numbers = generator.random_raw(start % 4 + stop - start)[start % 4:]
+    direction[movers] = (numbers % 4)[movers - start]
+    return len(movers), eaters, food_rows, dirty
+
+
+def keep_part(arrays, part, fields, kept):
+    """Compacts the given columns of part, keeping the rows that are alive (alive itself is left to the main process)."""
+    columns = arrays[part]
+    mask = columns['alive']
+    for field in fields:
+        column = columns[field]
+        column[:kept] = column[mask]
+
+
+class ParallelArrayEnvironment(ArrayEnvironment):
+    """
+    An ArrayEnvironment whose steps run on several cores.
+
+    Organism and food columns (and the food grid) live in shared memory. Every phase of a step is split in
+    contiguous ranges of rows, one per worker process: ageing, hunger and hp, each movement sub-step,
+    food ageing and decay, and the compaction of the columns. Whatever crosses from one range to another is
+    reconciled by the main process, in row order, with the same rules as ArrayEnvironment: when organisms
+    of different ranges land on the same food, the lowest row eats it; births and seeds are placed on free
+    cells (see sample_free_neighbours), in order, after every worker is done.
+
+    The direction an organism takes is drawn from a generator keyed by seed, step and sub-step, one number
+    per row: a run only depends on its seed, not on how many workers there are (but it differs from the
+    same seed on ArrayEnvironment). Small worlds are stepped in this process, with the same code, since
+    talking to workers costs more than the work itself.
+
+    How much this gains depends on the world: every movement sub-step is a round-trip through the pool, and
+    breeding, the reconciliation of eating, seeding and burials stay in the main process. Measure it on the
+    machine that will run it (python -m benchmarks.parallel --workers 1 4).
+
+    Call close() when done, to stop the workers and free the shared memory.
+    """
+    def __init__(self, *args, workers=None, min_rows_per_worker=20000, **kwargs):
+        self.workers = workers or os.cpu_count()
+        self.min_rows_per_worker = min_rows_per_worker
+        self.pool = None
+        self.shared = SharedBlocks()
+        super().__init__(*args, **kwargs)
+
+    def organism_columns(self):
+        return SharedOrganismColumns(self.shared)
+
+    def food_columns(self):
+        return SharedFoodColumns(self.shared)
+
+    def create_storage(self):
+        # Loading a checkpoint creates the storage again: the old blocks can go
+        for columns in (getattr(self, 'organisms', None), getattr(self, 'foods', None)):
+            if columns is not None:
+                columns.free()
+        if getattr(self, 'food_grid_block', None):
+            self.shared.free(self.food_grid_block)
+
+        super().create_storage()
+        self.food_grid, self.food_grid_block = self.shared.array((self.size, self.size), np.int32)
+        self.food_grid.fill(-1)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        self.shared.finalizer()
+
+    def layout(self):
+        return {'size': self.size, 'organisms': self.organisms.layout(), 'foods': self.foods.layout(),
+                'food_grid': self.food_grid_block}
+
+    def run_tasks(self, function, tasks):
+        """
+        Calls function(arrays, *task) for every task, in the workers if there's more than one.
+
+        Returns:
+            list: the results, in the order of the tasks.
+        """
+        if len(tasks) == 1 or self.workers == 1:
+            arrays = self.arrays()
+            return [function(arrays, *task) for task in tasks]
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        layout = self.layout()
+        futures = [self.pool.submit(in_worker, function, layout, *task) for task in tasks]
+        return [future.result() for future in futures]
+
+    def parts(self, n):
+        # Contiguous, ordered ranges of rows: one per worker, unless there are too few rows to bother
+        k = max(1, min(self.workers, n // self.min_rows_per_worker))
+        bounds = np.linspace(0, n, k + 1).astype(int)
+        return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+    def run_parts(self, function, n, *args):
+        # function(arrays, start, stop, *args) on every range of rows, results in row order
+        return self.run_tasks(function, [(start, stop) + args for start, stop in self.parts(n)])
+
+    def update_organisms(self):
+        dead = self.run_parts(update_organisms_part, len(self.organisms))
+        self.bury(np.concatenate(dead))
+
+    def move_organisms(self):
+        o = self.organisms
+        speeds = o.speed[o.alive]
+        track_dirty = self.dirty_keys is not None
+        for step in range(int(speeds.max()) if len(speeds) else 0):
+            key = derive_seed(self.seed, 'move', self.total_steps, step)
+            results = self.run_parts(move_part, len(o), step, key, track_dirty)
+
+            if track_dirty:
+                self.dirty_keys += [dirty for *_, dirty in results]
+
+            # Everybody who landed on food, in row order, as if one process had moved them all
+            meals = self.eat(np.concatenate([rows for _, rows, _, _ in results]),
+                             np.concatenate([food_rows for _, _, food_rows, _ in results]))
+
+            if self.instrumentation:
+                self.instrumentation.count('moves', sum(moved for moved, *_ in results))
+                self.instrumentation.count('meals', meals)
+
+    def update_food(self):
+        results = self.run_parts(update_food_part, len(self.foods), self.food_decay, self.dirty_keys is not None)
+        self.remove_food_rows(np.concatenate([rotten for rotten, _, _ in results]))
+        if self.dirty_keys is not None:
+            changed = np.concatenate([changed for _, changed, _ in results])
+            self.mark_dirty(self.foods.x[changed], self.foods.y[changed])
+        self.plant_seeds(np.concatenate([seeders for _, _, seeders in results]))
+
+    def compact(self):
+        # Every worker compacts a few whole columns (parts of the same column can't be compacted separately)
+        for columns, part in ((self.organisms, 'organisms'), (self.foods, 'foods')):
+            kept = int(columns.alive.sum())
+            if kept == len(columns):
+                continue
+            if columns is self.organisms:
+                self.track_followed(columns.alive)
+            fields = [name for name in columns.fields if name != 'alive']
+            if len(columns) < self.min_rows_per_worker:
+                groups = [fields]
+            else:
+                groups = [fields[i::self.workers] for i in range(min(self.workers, len(fields)))]
+            self.run_tasks(keep_part, [(part, group, kept) for group in groups])
+            columns.data['alive'][:kept] = True
+            columns.count = kept
+
+        f = self.foods
+        self.food_grid[f.x, f.y] = np.arange(len(f), dtype=np.int32)
+        self.index_organisms()
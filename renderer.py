@@ -0,0 +1,325 @@
+import time
+
+import numpy as np
+import pygame
+
+from sprites import SpriteCache
+
+# Keys that move the view around: w/a/s/d pan by a quarter of the view, +/- (and the mouse wheel) zoom
+PAN_KEYS = {pygame.K_w: (0, -1), pygame.K_s: (0, 1), pygame.K_a: (-1, 0), pygame.K_d: (1, 0)}
+ZOOM_IN_KEYS = (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS)
+ZOOM_OUT_KEYS = (pygame.K_MINUS, pygame.K_KP_MINUS)
+
+
+class Renderer:
+    """
+    Draws an Environment on a pygame window and listens to keyboard/mouse events.
+
+    The simulation itself never touches pygame: the environment only calls the renderer (if it has one)
+    to poll events, to throttle the frame rate and to draw a frame.
+
+    The window shows view x view cells of the world, starting from origin (the whole world by default):
+    only what falls inside it gets drawn. The world part of the window is never wider than max_pixels:
+    when the view has more cells than fit there as scale-pixel sprites, it is drawn as a heatmap instead,
+    with organisms and food binned into a density grid of at most one bin per pixel. Zooming in far enough
+    switches back to sprites.
+    """
+    def __init__(self, env, screen=None, view=None, max_pixels=1000):
+        self.env = env
+        self.scale = env.scale
+        self.size = env.size
+        self.view = min(view or env.size, env.size)
+        self.pixels = min(self.view * self.scale, max_pixels)
+        # The most cells per side that can be drawn as sprites: any more and we draw a heatmap
+        self.sprite_view = max(min(self.pixels // self.scale, self.size), 1)
+        self.origin = (0, 0)
+        self.screen = screen
+        if not self.screen:
+            self.screen = pygame.display.set_mode((self.pixels + 400, self.pixels))
+        self.clock = pygame.time.Clock()
+        self.sprites = SpriteCache(self.scale)
+        pygame.font.init()
+        self.font = pygame.font.SysFont('Consolas', 20)
+        self.title_font = pygame.font.SysFont('Consolas', max(self.pixels // 20, 20))
+
+        # Inspection never stops the simulation: events only note the cells under the mouse and clicked on, and
+        # every frame update_inspection looks them up in the live world (see update_inspection)
+        self.hovered = None
+        self.clicked = None
+        self.selected = None
+        self.selected_coord = None
+        self.inspection_text = ""
+        # The cell with the selection outline on it, to be cleaned up in the next frame
+        self.highlighted = None
+
+        # The first frame, and any frame after something was drawn over the world, is drawn from scratch
+        self.full_redraw = True
+
+    @property
+    def sidebar(self):
+        return self.pixels + 10
+
+    @property
+    def heatmap(self):
+        return self.view > self.sprite_view
+
+    def move_view(self, view, origin):
+        # Keeps the view inside the world
+        self.view = min(max(view, self.sprite_view), self.size)
+        limit = self.size - self.view
+        self.origin = (min(max(origin[0], 0), limit), min(max(origin[1], 0), limit))
+        self.full_redraw = True
+
+    def pan(self, dx, dy):
+        step = max(self.view // 4, 1)
+        self.move_view(self.view, (self.origin[0] + dx * step, self.origin[1] + dy * step))
+
+    def zoom(self, factor):
+        # Around the middle of the view: factor 2 shows twice as many cells per side, 0.5 half as many
+        view = min(max(int(self.view * factor), self.sprite_view), self.size)
+        middle = (self.origin[0] + self.view // 2, self.origin[1] + self.view // 2)
+        self.move_view(view, (middle[0] - view // 2, middle[1] - view // 2))
+
+    def handle_view_event(self, event):
+        """
+        Pans or zooms if event asks for it (see PAN_KEYS and friends).
+
+        Returns:
+            bool: whether it did.
+        """
+        if event.type == pygame.MOUSEWHEEL and event.y:
+            self.zoom(0.5 if event.y > 0 else 2)
+        elif event.type != pygame.KEYDOWN:
+            return False
+        elif event.key in PAN_KEYS:
+            self.pan(*PAN_KEYS[event.key])
+        elif event.key in ZOOM_IN_KEYS:
+            self.zoom(0.5)
+        elif event.key in ZOOM_OUT_KEYS:
+            self.zoom(2)
+        else:
+            return False
+        return True
+
+    def handle_inspection_event(self, event):
+        # In inspection mode, notes where the mouse is and what gets clicked. Returns whether event was one of those.
+        if not self.env.inspection_mode or event.type not in (pygame.MOUSEMOTION, pygame.MOUSEBUTTONUP):
+            return False
+        cell = self.cell_at(event.pos) if event.pos[0] < self.pixels else None
+        if event.type == pygame.MOUSEMOTION:
+            self.hovered = cell
+        elif cell is not None:
+            self.clicked = cell
+        return True
+
+    def cell_at(self, mouse_pos):
+        # The cell under a point of the window
+        return (self.origin[0] + mouse_pos[0] * self.view // self.pixels if self.heatmap else
+                self.origin[0] + mouse_pos[0] // self.scale,
+                self.origin[1] + mouse_pos[1] * self.view // self.pixels if self.heatmap else
+                self.origin[1] + mouse_pos[1] // self.scale)
+
+    def in_view(self, coord):
+        ox, oy = self.origin
+        return ox <= coord[0] < ox + self.view and oy <= coord[1] < oy + self.view
+
+    def visible(self, world):
+        """
+        Returns:
+            tuple: the organisms and the food items of world that fall inside the view.
+        """
+        if self.view == world.size:
+            return world.population, world.food
+        ox, oy = self.origin
+        return world.entities_in_area(ox, oy, ox + self.view, oy + self.view)
+
+    def wait_frame(self, fps):
+        # Waits until at least 1/fps seconds have passed from the previous frame.
+        # (for example, if fps is 5, we want to wait 200ms between frames)
+        self.clock.tick(fps)
+
+    def handle_events(self):
+        # This is where we check for a pause button, or a stop button, or an inspection button
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                self.env.end_simulation = True
+            if self.handle_view_event(event) or self.handle_inspection_event(event):
+                continue
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_SPACE:
+                    self.env.pause_simulation = not self.env.pause_simulation
+                elif event.key == pygame.K_q:
+                    self.env.end_simulation = True
+                elif event.key == pygame.K_i:
+                    self.env.inspection_mode = not self.env.inspection_mode
+
+    def update_inspection(self, env, world=None):
+        """
+        Looks up what inspection shows: the entity clicked on (followed as it moves in env, the live world, with its
+        details refreshed every frame until it is gone) and what is under the mouse.
+
+        Clicks and hovers are about the frame on screen, so they have to be looked up in the world that frame was
+        drawn from, before it changes: env itself, right after the events (see Environment.simulate_rendered), or
+        world, the WorldSnapshot drawn last by a threaded simulation. That one is a few steps behind env, which
+        holds still meanwhile: what was clicked on it is found again in env (see Environment.find).
+        """
+        if not env.inspection_mode:
+            self.hovered = self.clicked = self.selected = self.selected_coord = None
+            self.inspection_text = ""
+            return
+        if self.clicked is not None:
+            if world is None:
+                self.selected = env.entity_at(self.clicked)
+            else:
+                picked = world.entity_at(self.clicked)
+                self.selected = env.find(picked) if picked is not None else None
+            self.clicked = None
+        if self.selected is not None:
+            self.selected = env.follow(self.selected)
+        self.selected_coord = self.selected.coord if self.selected is not None else None
+
+        info_text = "INSPECTION MODE\n"
+        if self.hovered is not None:
+            entity = (env if world is None else world).entity_at(self.hovered)
+            info_text += f"Under the mouse: {entity.sprite if entity is not None else 'nothing'}\n"
+        info_text += self.selected.display_info if self.selected is not None else "Click on something\n"
+        self.inspection_text = info_text
+
+    def draw_highlight(self):
+        # An outline around the inspected entity (sprite mode only). Returns the rect to update, if any.
+        cell = self.selected_coord
+        if cell is None or self.heatmap or not self.in_view(cell):
+            return None
+        self.highlighted = cell
+        rect = pygame.Rect((cell[0] - self.origin[0]) * self.scale, (cell[1] - self.origin[1]) * self.scale,
+                           self.scale, self.scale)
+        pygame.draw.rect(self.screen, pygame.color.Color('Blue'), rect, 1)
+        return rect
+
+    def blits(self, organisms, food):
+        # Every sprite comes already tinted from the cache, and they all go to the screen in one call
+        scale = self.scale
+        ox, oy = self.origin
+        blits = [(self.sprites.organism(organism), ((organism.coord[0] - ox) * scale, (organism.coord[1] - oy) * scale))
+                 for organism in organisms]
+        blits += [(self.sprites.food(food), ((food.coord[0] - ox) * scale, (food.coord[1] - oy) * scale))
+                  for food in food]
+        self.screen.blits(blits, doreturn=False)
+
+    def density(self, x, y, bins):
+        """
+        Returns:
+            numpy.ndarray: a bins x bins grid with, in every bin, the share of its cells (from 0 to 1) that are among
+            the given x, y.
+        """
+        ox, oy = self.origin
+        inside = (x >= ox) & (x < ox + self.view) & (y >= oy) & (y < oy + self.view)
+        bx = (x[inside] - ox) * bins // self.view
+        by = (y[inside] - oy) * bins // self.view
+        counts = np.bincount(bx * bins + by, minlength=bins * bins).reshape(bins, bins)
+        return np.minimum(counts * (bins / self.view) ** 2, 1)
+
+    def draw_heatmap(self, world):
+        # Green where food is, red where organisms are (darker where both are), on white: every bin is one pixel
+        # of a small surface, stretched to the window in a single blit
+        bins = min(self.view, self.pixels)
+        organisms_x, organisms_y, food_x, food_y = world.occupied_cells()
+        # The square root makes sparse bins easier to see
+        organisms = np.sqrt(self.density(organisms_x, organisms_y, bins))
+        food = np.sqrt(self.density(food_x, food_y, bins))
+        pixels = np.empty((bins, bins, 3), dtype=np.uint8)
+        pixels[..., 0] = 255 * (1 - food)
+        pixels[..., 1] = 255 * (1 - organisms)
+        pixels[..., 2] = 255 * (1 - np.maximum(food, organisms))
+        surface = pygame.surfarray.make_surface(pixels)
+        self.screen.blit(pygame.transform.scale(surface, (self.pixels, self.pixels)), (0, 0))
+
+    def draw_sidebar(self, world):
+        # We print a little summary on the side of the screen
+        rect = pygame.Rect(self.sidebar, 0, self.screen.get_width() - self.sidebar, self.screen.get_height())
+        self.screen.fill((255, 255, 255), rect)
+        info_text = world.sidebar_info_text()
+        if self.view < self.size:
+            info_text += f"View: {self.view}x{self.view} at {self.origin}\n"
+        info_text += self.inspection_text
+        text = self.font.render(info_text, True, pygame.color.Color('Black'))
+        self.screen.blit(text, (self.sidebar, 0))
+        return rect
+
+    def draw(self, world=None):
+        """
+        Draws a frame of world: either the live environment (the default) or a WorldSnapshot of it.
+        """
+        if world is None:
+            world = self.env
+            self.update_inspection(world)
+        dirty = world.pop_dirty_cells()
+
+        # Too many cells for sprites: the whole view is one picture, redrawn every frame
+        if self.heatmap:
+            self.screen.fill((255, 255, 255))
+            self.draw_heatmap(world)
+            self.draw_sidebar(world)
+            pygame.display.flip()
+            return
+
+        # When we don't know what changed, or almost everything did, a full redraw is cheaper
+        if dirty is not None and self.highlighted is not None:
+            # Last frame's outline has to go
+            dirty.add(self.highlighted)
+            self.highlighted = None
+        if dirty is not None and self.view < world.size:
+            dirty = {cell for cell in dirty if self.in_view(cell)}
+        if self.full_redraw or dirty is None or len(dirty) * 2 > self.view ** 2:
+            self.full_redraw = False
+            self.screen.fill((255, 255, 255))
+            self.blits(*self.visible(world))
+            self.draw_highlight()
+            self.draw_sidebar(world)
+            pygame.display.flip()
+            return
+
+        # Otherwise we clear and redraw only the cells that changed, and push only those to the display
+        scale = self.scale
+        ox, oy = self.origin
+        rects = [pygame.Rect((x - ox) * scale, (y - oy) * scale, scale, scale) for x, y in dirty]
+        for rect in rects:
+            self.screen.fill((255, 255, 255), rect)
+        self.blits(*world.entities_in(dirty))
+        highlight = self.draw_highlight()
+        if highlight:
+            rects.append(highlight)
+        rects.append(self.draw_sidebar(world))
+        pygame.display.update(rects)
+
+    def pause(self):
+        pixels = self.pixels
+        pause_text = self.title_font.render('PAUSA', True, pygame.color.Color('Black'))
+        text_width = pause_text.get_width()
+        text_height = pause_text.get_height()
+        self.screen.blit(pause_text,
+                        (int(pixels / 2) - int(text_width / 2),
+                         int(pixels / 2) - int(text_height / 2))
+                         )
+        pygame.display.flip()
+
+        # Mentre siamo in pausa, non succede niente. L'unica cosa che facciamo è
+        # ascoltare eventi, per uscire dalla pausa o dalla simulazione (e rispondere all'ispezione).
+        while self.env.pause_simulation:
+            time.sleep(0.1)
+            inspected = False
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    self.env.end_simulation = True
+                if event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_SPACE:
+                        self.env.pause_simulation = not self.env.pause_simulation
+                    elif event.key == pygame.K_i:
+                        self.env.inspection_mode = not self.env.inspection_mode
+                        inspected = True
+                inspected = self.handle_inspection_event(event) or inspected
+            if inspected:
+                self.update_inspection(self.env)
+                pygame.display.update(self.draw_sidebar(self.env))
+
+        self.full_redraw = True
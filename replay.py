@@ -0,0 +1,426 @@
+"""
+Replays: what a simulation looked like, step after step, recorded while it runs headless and played back
+later at any speed, forwards or backwards, without simulating anything again.
+
+The recording is a delta log. Every step stores the cells whose content changed (the same dirty cells the
+renderer redraws: that is what spawns, moves, meals, births, deaths and food events amount to on screen)
+together with everything that sits on them now. Every keyframe_every steps a keyframe stores the whole world
+instead, so the player can jump anywhere by going back to the nearest keyframe and applying the deltas
+from there. A replay shows exactly what the renderer would have drawn, no more: the decay of a food item, for
+one, is the one it had the last time its cell changed.
+
+Like checkpoints, a replay is made of compressed NumPy archives (.npz) of flat arrays, with a little JSON
+metadata and nothing pickled: one archive per keyframe interval (run.0000.npz, run.0001.npz and so on for
+run.npz), written as the run goes. Recording needs neither pygame nor a screen; only the player does.
+
+    env = Environment(size=500, n=200, headless=True, replay=ReplayRecorder('run.npz'))
+    env.simulate(100)
+
+    python replay.py run.npz
+"""
+import argparse
+import json
+import os
+from array import array
+
+import numpy as np
+
+from snapshot import FoodSnapshot, OrganismSnapshot, occupied_cells
+
+VERSION = 2
+
+# The same names as sprites.SPRITES, which we can't import here without pygame
+SPRITES = ['organism', 'baby', 'pregnant', 'food', 'sprout']
+SPRITE_CODES = {sprite: code for code, sprite in enumerate(SPRITES)}
+
+# One value per frame
+FRAME_FIELDS = ['step', 'day', 'steps_today', 'population', 'food', 'keyframe']
+# One value per changed cell, per organism and per food item on a changed cell
+CELL_FIELDS = ['x', 'y']
+ORGANISM_FIELDS = ['x', 'y', 'sprite', 'flipped', 'hp']
+FOOD_FIELDS = ['x', 'y', 'sprite', 'decay']
+
+
+def part_path(path, part):
+    # run.npz -> run.0000.npz, run.0001.npz... like the rotated files of CSVMetricsSink
+    # (only the file name has an extension: directories may have dots in their names too)
+    stem, extension = os.path.splitext(path)
+    return f'{stem}.{part:04d}{extension or ".npz"}'
+
+
+class ReplayRecorder:
+    """
+    Records a replay of the environment it is given to (Environment(..., replay=ReplayRecorder(path))).
+
+    The environment calls record() once when it is created and once after every step. Frames are kept in
+    memory, in compact arrays, one part at a time: every keyframe starts a new part, and the one before it is
+    written to its own file then (see part_path). However long the run, only one keyframe interval is held in
+    memory, and a crash loses no more than that. flush() writes the part being recorded as it is so far
+    (simulate() does it when it returns).
+
+    Args:
+        path (str): Where the replay goes: run.npz is written as run.0000.npz, run.0001.npz and so on.
+        keyframe_every (int, optional): Frames between two keyframes: fewer means faster seeking, smaller parts
+            and bigger files. Defaults to 100.
+    """
+    def __init__(self, path, keyframe_every=100):
+        self.path = path
+        self.keyframe_every = keyframe_every
+        self.config = None
+        self.part = 0
+        # Frames in the parts already written
+        self.written = 0
+        self.clear()
+
+    def clear(self):
+        self.frames = {name: array('q') for name in FRAME_FIELDS}
+        self.cells = {name: array('i') for name in CELL_FIELDS}
+        self.organisms = {name: array('i') for name in ORGANISM_FIELDS}
+        self.food = {name: array('i') for name in FOOD_FIELDS}
+        # Where the cells, organisms and food of every frame start, plus where the last one ends
+        self.cell_start = array('q', [0])
+        self.organism_start = array('q', [0])
+        self.food_start = array('q', [0])
+
+    def __len__(self):
+        return self.written + len(self.frames['step'])
+
+    def restart(self, env):
+        """
+        Throws away what was recorded so far and starts again, with a keyframe of env as it is now. Environments
+        call it when their whole world is replaced (loading a checkpoint).
+        """
+        self.config = None
+        self.part = 0
+        self.written = 0
+        self.clear()
+        self.record(env)
+
+    def record(self, env):
+        if self.config is None:
+            self.config = {'size': env.size, 'seed': env.seed, 'steps_per_day': env.steps_per_day, 'info': env.info}
+            # Parts left there by an older recording would be read as the continuation of this one
+            part = 0
+            while os.path.exists(part_path(self.path, part)):
+                os.remove(part_path(self.path, part))
+                part += 1
+
+        cells = env.pop_dirty_cells()
+        keyframe = cells is None or len(self) % self.keyframe_every == 0
+        if keyframe and len(self.frames['step']):
+            self.flush()
+            self.written += len(self.frames['step'])
+            self.part += 1
+            self.clear()
+        if keyframe:
+            organisms, food = list(env.population), list(env.food)
+            cells = {organism.coord for organism in organisms} | {food.coord for food in food}
+        else:
+            organisms, food = env.entities_in(cells)
+
+        for name, value in zip(FRAME_FIELDS, (env.total_steps, env.day, env.steps_today, len(env.population),
+                                              len(env.food), keyframe)):
+            self.frames[name].append(value)
+        for x, y in cells:
+            self.cells['x'].append(x)
+            self.cells['y'].append(y)
+        for organism in organisms:
+            for name, value in zip(ORGANISM_FIELDS, (*organism.coord, SPRITE_CODES[organism.sprite],
+                                                     organism.flipped, organism.hp)):
+                self.organisms[name].append(value)
+        for food_item in food:
+            for name, value in zip(FOOD_FIELDS, (*food_item.coord, SPRITE_CODES[food_item.sprite], food_item.decay)):
+                self.food[name].append(value)
+        self.cell_start.append(len(self.cells['x']))
+        self.organism_start.append(len(self.organisms['x']))
+        self.food_start.append(len(self.food['x']))
+
+    def flush(self):
+        """
+        Writes the part being recorded to its file. Like checkpoints, the file is written next to its final path
+        first and then moved in place.
+        """
+        if not len(self.frames['step']):
+            return
+        arrays = {f'frames.{name}': np.frombuffer(values, dtype=np.int64) for name, values in self.frames.items()}
+        for group, columns in (('cells', self.cells), ('organisms', self.organisms), ('food', self.food)):
+            arrays.update({f'{group}.{name}': np.frombuffer(values, dtype=np.int32) for name, values in columns.items()})
+        arrays['cell_start'] = np.frombuffer(self.cell_start, dtype=np.int64)
+        arrays['organism_start'] = np.frombuffer(self.organism_start, dtype=np.int64)
+        arrays['food_start'] = np.frombuffer(self.food_start, dtype=np.int64)
+        meta = {'version': VERSION, 'keyframe_every': self.keyframe_every, 'config': self.config}
+        arrays['meta'] = np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8)
+
+        path = part_path(self.path, self.part)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp_path, path)
+
+    def close(self):
+        self.flush()
+
+
+class Replay:
+    """
+    A recorded replay (see ReplayRecorder), read from the parts of path, frame by frame. The counters of every
+    frame are read upfront; the cells and entities of a part only when a frame of it is played.
+    """
+    def __init__(self, path):
+        self.paths = []
+        while os.path.exists(part_path(path, len(self.paths))):
+            self.paths.append(part_path(path, len(self.paths)))
+        if not self.paths:
+            raise FileNotFoundError(f'No replay at {path} (looked for {part_path(path, 0)})')
+
+        parts = []
+        for part in self.paths:
+            with np.load(part, allow_pickle=False) as archive:
+                parts.append({name: archive[f'frames.{name}'] for name in FRAME_FIELDS})
+                if len(parts) == 1:
+                    meta = json.loads(archive['meta'].tobytes().decode())
+        self.keyframe_every = meta['keyframe_every']
+        self.config = meta['config']
+        self.size = self.config['size']
+        self.frames = {name: np.concatenate([part[name] for part in parts]) for name in FRAME_FIELDS}
+        # The first frame of every part, plus where the last one ends
+        self.part_start = np.cumsum([0] + [len(part['step']) for part in parts])
+        self.keyframes = np.flatnonzero(self.frames['keyframe'])
+        self.loaded = None
+
+    def __len__(self):
+        return len(self.frames['step'])
+
+    def frame_at_step(self, step):
+        # The last frame recorded at or before step
+        return max(int(np.searchsorted(self.frames['step'], step, side='right')) - 1, 0)
+
+    def frame_at_day(self, day):
+        # The first frame of day (or the last frame, if the run never got there)
+        return min(int(np.searchsorted(self.frames['day'], day, side='left')), len(self) - 1)
+
+    def keyframe_before(self, frame):
+        return int(self.keyframes[np.searchsorted(self.keyframes, frame, side='right') - 1])
+
+    def counters(self, frame):
+        return {name: int(values[frame]) for name, values in self.frames.items()}
+
+    def load_part(self, part):
+        # Only the part being played is kept in memory (seeking never needs more: every part starts with a keyframe)
+        if self.loaded is None or self.loaded[0] != part:
+            with np.load(self.paths[part], allow_pickle=False) as archive:
+                self.loaded = part, {name: archive[name] for name in archive.files}
+        return self.loaded[1]
+
+    def changes(self, frame):
+        """
+        Returns:
+            tuple: the cells that changed in frame, and the organisms and the food items (as OrganismSnapshot and
+            FoodSnapshot) that sit on them after it.
+        """
+        part = int(np.searchsorted(self.part_start, frame, side='right')) - 1
+        arrays = self.load_part(part)
+        frame -= int(self.part_start[part])
+
+        start, stop = arrays['cell_start'][frame], arrays['cell_start'][frame + 1]
+        cells = list(zip(arrays['cells.x'][start:stop].tolist(), arrays['cells.y'][start:stop].tolist()))
+
+        start, stop = arrays['organism_start'][frame], arrays['organism_start'][frame + 1]
+        columns = [arrays[f'organisms.{name}'][start:stop].tolist() for name in ORGANISM_FIELDS]
+        organisms = [OrganismSnapshot((x, y), SPRITES[sprite], bool(flipped), hp)
+                     for x, y, sprite, flipped, hp in zip(*columns)]
+
+        start, stop = arrays['food_start'][frame], arrays['food_start'][frame + 1]
+        columns = [arrays[f'food.{name}'][start:stop].tolist() for name in FOOD_FIELDS]
+        food = [FoodSnapshot((x, y), SPRITES[sprite], decay) for x, y, sprite, decay in zip(*columns)]
+        return cells, organisms, food
+
+
+class ReplayWorld:
+    """
+    The world as a replay shows it at one frame. It offers the same few methods the renderer uses on a live
+    environment (like WorldSnapshot), so the renderer draws it incrementally as frames are applied.
+    """
+    def __init__(self, size):
+        self.size = size
+        # cell -> (organisms, food) on it, as lists of OrganismSnapshot and FoodSnapshot
+        self.cells = {}
+        self.dirty_cells = None
+        self.info_text = ""
+
+    def reset(self):
+        self.cells.clear()
+        # Everything has to be redrawn
+        self.dirty_cells = None
+
+    def apply(self, cells, organisms, food):
+        for cell in cells:
+            self.cells.pop(cell, None)
+        for organism in organisms:
+            self.cells.setdefault(organism.coord, ([], []))[0].append(organism)
+        for food_item in food:
+            self.cells.setdefault(food_item.coord, ([], []))[1].append(food_item)
+        if self.dirty_cells is not None:
+            self.dirty_cells.update(cells)
+
+    @property
+    def population(self):
+        return [organism for organisms, _ in self.cells.values() for organism in organisms]
+
+    @property
+    def food(self):
+        return [food_item for _, food in self.cells.values() for food_item in food]
+
+    def pop_dirty_cells(self):
+        cells = self.dirty_cells
+        self.dirty_cells = set()
+        return cells
+
+    def entities_in(self, cells):
+        organisms, food = [], []
+        for cell in cells:
+            entities = self.cells.get(cell)
+            if entities:
+                organisms += entities[0]
+                food += entities[1]
+        return organisms, food
+
+    def entities_in_area(self, x0, y0, x1, y1):
+        return self.entities_in([cell for cell in self.cells if x0 <= cell[0] < x1 and y0 <= cell[1] < y1])
+
+    def occupied_cells(self):
+        return occupied_cells([cell for cell, (organisms, _) in self.cells.items() if organisms],
+                              [cell for cell, (_, food) in self.cells.items() if food])
+
+    def sidebar_info_text(self):
+        return self.info_text
+
+
+class ReplayPlayer:
+    """
+    Plays a replay on a pygame window, through the same Renderer as live simulations.
+
+    Keys: space pauses, right/left jump one day forward/back, up/down double/halve the speed, r plays backwards,
+    . and , move one frame at a time, home goes back to the start and q quits. w/a/s/d, +/- and the mouse wheel
+    pan and zoom like in a live simulation.
+
+    Args:
+        path (str): The replay file.
+        screen (pygame.Surface, optional): Where to draw. Defaults to None, which will open a window.
+        scale (int, optional): Pixels per cell. Defaults to 10.
+        view (int, optional): Cells shown per side (see Renderer). Defaults to None, the whole world.
+        max_pixels (int, optional): The widest the world can be drawn (see Renderer). Defaults to 1000.
+    """
+    def __init__(self, path, screen=None, scale=10, view=None, max_pixels=1000):
+        from renderer import Renderer
+
+        self.replay = Replay(path)
+        self.size = self.replay.size
+        self.scale = scale
+        self.world = ReplayWorld(self.size)
+        self.frame = -1
+        # Frames played per frame drawn: negative plays backwards
+        self.speed = 1
+        self.end_simulation = False
+        self.pause_simulation = False
+        self.inspection_mode = False
+        self.renderer = Renderer(self, screen, view, max_pixels)
+        self.seek(0)
+
+    def seek(self, frame):
+        """Shows frame, going through the nearest keyframe when it is behind us or too far ahead."""
+        replay = self.replay
+        frame = min(max(frame, 0), len(replay) - 1)
+        keyframe = replay.keyframe_before(frame)
+        if frame < self.frame or keyframe > self.frame:
+            self.world.reset()
+            self.frame = keyframe - 1
+        for i in range(self.frame + 1, frame + 1):
+            self.world.apply(*replay.changes(i))
+        self.frame = frame
+        self.world.info_text = self.sidebar_info_text()
+
+    def seek_step(self, step):
+        self.seek(self.replay.frame_at_step(step))
+
+    def seek_day(self, day):
+        self.seek(self.replay.frame_at_day(day))
+
+    def sidebar_info_text(self):
+        counters = self.replay.counters(self.frame)
+        info_text = ""
+        info_text += f"Day: {counters['day']}\n"
+        info_text += f"Steps Today: {counters['steps_today']}\n"
+        info_text += f"Food: {counters['food']}\n"
+        info_text += f"Population: {counters['population']}\n"
+        info_text += f"Replay: {self.frame + 1}/{len(self.replay)}\n"
+        info_text += f"Speed: {self.speed}x{' (paused)' if self.pause_simulation else ''}\n"
+        return info_text
+
+    def handle_events(self):
+        import pygame
+
+        day = self.replay.counters(self.frame)['day']
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                self.end_simulation = True
+            if self.renderer.handle_view_event(event) or event.type != pygame.KEYDOWN:
+                continue
+            if event.key == pygame.K_q:
+                self.end_simulation = True
+            elif event.key == pygame.K_SPACE:
+                self.pause_simulation = not self.pause_simulation
+            elif event.key == pygame.K_RIGHT:
+                self.seek_day(day + 1)
+            elif event.key == pygame.K_LEFT:
+                # Back to the start of today, or of yesterday if we are already there
+                frame = self.replay.frame_at_day(day)
+                self.seek(frame if frame < self.frame else self.replay.frame_at_day(day - 1))
+            elif event.key == pygame.K_UP:
+                self.speed *= 2
+            elif event.key == pygame.K_DOWN and abs(self.speed) > 1:
+                self.speed //= 2
+            elif event.key == pygame.K_r:
+                self.speed = -self.speed
+            elif event.key == pygame.K_PERIOD:
+                self.seek(self.frame + 1)
+            elif event.key == pygame.K_COMMA:
+                self.seek(self.frame - 1)
+            elif event.key == pygame.K_HOME:
+                self.seek(0)
+
+    def play(self, fps=30):
+        """Plays until q is pressed or the window is closed. At either end of the replay, playback pauses."""
+        while not self.end_simulation:
+            self.handle_events()
+            if not self.pause_simulation:
+                frame = self.frame
+                self.seek(frame + self.speed)
+                if self.frame == frame:
+                    self.pause_simulation = True
+            self.world.info_text = self.sidebar_info_text()
+            self.renderer.draw(self.world)
+            self.renderer.wait_frame(fps)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play back a recorded simulation.')
+    parser.add_argument('path', help='the path the replay was recorded to (e.g. run.npz, for run.0000.npz...)')
+    parser.add_argument('--scale', type=int, default=10, help='pixels per cell')
+    parser.add_argument('--view', type=int, help='cells shown per side (default: the whole world)')
+    parser.add_argument('--fps', type=int, default=30, help='frames drawn per second')
+    parser.add_argument('--speed', type=int, default=1, help='steps played per frame drawn')
+    parser.add_argument('--day', type=int, help='start from this day')
+    args = parser.parse_args()
+
+    import pygame
+    pygame.init()
+    player = ReplayPlayer(args.path, scale=args.scale, view=args.view)
+    player.speed = args.speed
+    if args.day is not None:
+        player.seek_day(args.day)
+    player.play(args.fps)
+
+
+if __name__ == '__main__':
+    main()
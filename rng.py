@@ -0,0 +1,34 @@
+import hashlib
+import random
+
+# One independent stream of random numbers for each part of the simulation
+STREAMS = ['spawn', 'move', 'breed', 'food']
+
+
+def derive_seed(seed, *keys):
+    """
+    A 64 bit seed derived deterministically from seed and any number of keys (strings, numbers, tuples...).
+
+    Different keys give unrelated seeds, so derive_seed(seed, 'worker', 3) can seed the fourth of a set of
+    parallel runs: every run is independent of the others and can be reproduced on its own.
+    """
+    digest = hashlib.blake2b(repr((seed,) + keys).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+def new_seed():
+    return random.SystemRandom().getrandbits(63)
+
+
+class Streams:
+    """
+    A random generator for each subsystem (see STREAMS), all split from a single seed.
+
+    Keeping them apart means, for example, that a change in how many organisms are born does not shift
+    the sequence of directions they walk in. factory turns a derived seed into a generator: random.Random
+    for the object backend, numpy.random.default_rng for the array one.
+    """
+    def __init__(self, seed, factory=random.Random):
+        self.seed = seed
+        for name in STREAMS:
+            setattr(self, name, factory(derive_seed(seed, name)))
@@ -0,0 +1,70 @@
+import itertools
+from collections import namedtuple
+
+# number lets inspection find the organism again in the live world (replays don't record it)
+OrganismSnapshot = namedtuple('OrganismSnapshot', ['coord', 'sprite', 'flipped', 'hp', 'number'], defaults=[None])
+FoodSnapshot = namedtuple('FoodSnapshot', ['coord', 'sprite', 'decay'])
+
+
+def occupied_cells(organism_cells, food_cells):
+    """
+    Turns two collections of (x, y) cells into NumPy arrays, for the renderer's heatmap.
+
+    Returns:
+        tuple: the x and the y of organism_cells, then the x and the y of food_cells.
+    """
+    import numpy as np
+    arrays = []
+    for cells in (organism_cells, food_cells):
+        xy = np.fromiter(itertools.chain.from_iterable(cells), dtype=np.int64, count=2 * len(cells))
+        arrays += [xy[0::2], xy[1::2]]
+    return tuple(arrays)
+
+
+class WorldSnapshot:
+    """
+    A frozen copy of what the renderer needs from an environment: where everything is, what it looks like,
+    which cells changed since the previous snapshot and the sidebar text.
+
+    It offers the same few methods the renderer uses on a live environment, so a frame can be drawn from it
+    while the simulation keeps running in another thread.
+    """
+    def __init__(self, env):
+        self.size = env.size
+        self.population = [OrganismSnapshot(organism.coord, organism.sprite, organism.flipped, organism.hp,
+                                            organism.number)
+                           for organism in env.population]
+        self.food = [FoodSnapshot(food.coord, food.sprite, food.decay) for food in env.food]
+        self.dirty_cells = env.pop_dirty_cells()
+        self.info_text = env.sidebar_info_text()
+        # cell -> what inspection shows for it, built the first time somebody asks
+        self.entities = None
+
+    def pop_dirty_cells(self):
+        return self.dirty_cells
+
+    def entities_in(self, cells):
+        organisms = [organism for organism in self.population if organism.coord in cells]
+        food = [food for food in self.food if food.coord in cells]
+        return organisms, food
+
+    def entities_in_area(self, x0, y0, x1, y1):
+        organisms = [organism for organism in self.population
+                     if x0 <= organism.coord[0] < x1 and y0 <= organism.coord[1] < y1]
+        food = [food for food in self.food if x0 <= food.coord[0] < x1 and y0 <= food.coord[1] < y1]
+        return organisms, food
+
+    def occupied_cells(self):
+        return occupied_cells([organism.coord for organism in self.population], [food.coord for food in self.food])
+
+    def entity_at(self, cell):
+        # Like Environment.entity_at: the food on cell, or else the first organism on it
+        if self.entities is None:
+            self.entities = {}
+            for organism in reversed(self.population):
+                self.entities[organism.coord] = organism
+            self.entities.update((food.coord, food) for food in self.food)
+        return self.entities.get(cell)
+
+    def sidebar_info_text(self):
+        return self.info_text
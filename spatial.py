@@ -0,0 +1,62 @@
+class SpatialIndex:
+    """
+    Keeps track of which entities sit on which cell of the grid.
+
+    The environment updates it as entities spawn, move and disappear, so looking up a coordinate is O(1)
+    instead of rebuilding a {coord: entity} dict from the whole list every time.
+    More than one entity can share a cell: lookups return the first one that got there.
+    If a dirty set is given, every cell that gains or loses an entity is added to it.
+    """
+    def __init__(self, dirty=None):
+        self.cells = {}
+        self.dirty = dirty
+
+    def add(self, entity, coord=None):
+        coord = coord or entity.coord
+        if self.dirty is not None:
+            self.dirty.add(coord)
+        bucket = self.cells.get(coord)
+        if bucket is None:
+            self.cells[coord] = [entity]
+        else:
+            bucket.append(entity)
+
+    def remove(self, entity, coord=None):
+        coord = coord or entity.coord
+        if self.dirty is not None:
+            self.dirty.add(coord)
+        bucket = self.cells.get(coord)
+        if bucket is None:
+            return
+        if entity in bucket:
+            bucket.remove(entity)
+        if not bucket:
+            del self.cells[coord]
+
+    def move(self, entity, old_coord, new_coord):
+        if old_coord == new_coord:
+            return
+        self.remove(entity, old_coord)
+        self.add(entity, new_coord)
+
+    def get(self, coord, default=None):
+        bucket = self.cells.get(coord)
+        return bucket[0] if bucket else default
+
+    def get_all(self, coord):
+        return self.cells.get(coord, [])
+
+    def keys(self):
+        return self.cells.keys()
+
+    def clear(self):
+        self.cells.clear()
+
+    def __getitem__(self, coord):
+        return self.cells[coord][0]
+
+    def __contains__(self, coord):
+        return coord in self.cells
+
+    def __len__(self):
+        return len(self.cells)
@@ -0,0 +1,69 @@
+import os
+from collections import OrderedDict
+
+import pygame
+
+SPRITES = ['organism', 'baby', 'pregnant', 'food', 'sprout']
+
+FOOD_COLOR = (0, 255, 0)
+WILTED_FOOD_COLOR = (115, 130, 100)
+
+# hp is drawn in steps of HP_BUCKET, so that there are only a few dozen different reds to cache
+HP_BUCKET = 5
+
+
+def organism_color(hp):
+    hp = max(hp, 0) // HP_BUCKET * HP_BUCKET
+    return (int(255 / 100 * hp), 0, 0)
+
+
+def food_color(decay):
+    return WILTED_FOOD_COLOR if decay < 10 else FOOD_COLOR
+
+
+class SpriteCache:
+    """
+    Loads every sprite of a given scale once, and keeps the tinted (and flipped) versions that have
+    already been asked for, so drawing a frame does no disk I/O and allocates no surfaces.
+
+    Tinted surfaces are keyed by (sprite, flipped, color) and the least recently used ones are dropped
+    once there are more than max_size of them.
+    """
+    def __init__(self, scale, max_size=256):
+        self.scale = scale
+        self.max_size = max_size
+        self.atlas = {}
+        for sprite in SPRITES:
+            path = f'res/{scale}/{sprite}.png'
+            if os.path.exists(path):
+                self.atlas[sprite] = pygame.image.load(path).convert_alpha()
+        self.tinted = OrderedDict()
+
+    def base(self, sprite):
+        # Not every scale has every sprite: babies and pregnant organisms fall back to the adult one
+        return self.atlas.get(sprite) or self.atlas['organism' if sprite in ('baby', 'pregnant') else 'food']
+
+    def get(self, sprite, flipped, color):
+        key = (sprite, flipped, color)
+        image = self.tinted.get(key)
+        if image is not None:
+            self.tinted.move_to_end(key)
+            return image
+
+        image = self.base(sprite)
+        if flipped:
+            image = pygame.transform.flip(image, True, False)
+        else:
+            image = image.copy()
+        image.fill(color + (255,), special_flags=pygame.BLEND_RGBA_MULT)
+
+        self.tinted[key] = image
+        if len(self.tinted) > self.max_size:
+            self.tinted.popitem(last=False)
+        return image
+
+    def organism(self, organism):
+        return self.get(organism.sprite, organism.flipped, organism_color(organism.hp))
+
+    def food(self, food):
+        return self.get(food.sprite, False, food_color(food.decay))
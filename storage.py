@@ -0,0 +1,60 @@
+class EntityList:
+    """
+    A list of entities with O(1) removal and stable iteration.
+
+    Every entity remembers its slot. Removing it leaves a hole (None) in that slot instead of shifting
+    everything after it, and holes are squeezed out later by compact(), which the environment calls once
+    at the end of every step.
+
+    Iterating only goes through the slots that existed when the iteration started: entities removed in the
+    meantime are skipped, entities added in the meantime wait for the next iteration, and nobody else is
+    skipped or visited twice.
+    """
+    def __init__(self, entities=()):
+        self.slots = []
+        self.holes = 0
+        for entity in entities:
+            self.append(entity)
+
+    def append(self, entity):
+        entity.slot = len(self.slots)
+        self.slots.append(entity)
+
+    def remove(self, entity):
+        slot = entity.slot
+        if slot is None or slot >= len(self.slots) or self.slots[slot] is not entity:
+            raise ValueError('entity is not in this list')
+        self.slots[slot] = None
+        entity.slot = None
+        self.holes += 1
+
+    def compact(self, force=False):
+        # Rebuilding the list costs O(n), so we only do it once holes are a good share of it
+        if not self.holes or (not force and self.holes * 4 < len(self.slots)):
+            return
+        self.slots = [entity for entity in self.slots if entity is not None]
+        for slot, entity in enumerate(self.slots):
+            entity.slot = slot
+        self.holes = 0
+
+    def __iter__(self):
+        # Which slots get visited is settled here, when the iterator is created, not at its first next()
+        return self.iterate(self.slots, len(self.slots))
+
+    @staticmethod
+    def iterate(slots, n):
+        for slot in range(n):
+            entity = slots[slot]
+            if entity is not None:
+                yield entity
+
+    def __len__(self):
+        return len(self.slots) - self.holes
+
+    def __contains__(self, entity):
+        slot = getattr(entity, 'slot', None)
+        return slot is not None and slot < len(self.slots) and self.slots[slot] is entity
+
+    def __getitem__(self, index):
+        self.compact(force=True)
+        return self.slots[index]
@@ -0,0 +1,142 @@
+from env import Environment
+from storage import EntityList
+
+
+class Chunk:
+    """The organisms and the food items of one square of chunk_size x chunk_size cells."""
+    __slots__ = ('organisms', 'food')
+
+    def __init__(self):
+        # A dict used as an ordered set, so that going through a chunk always gives the same order
+        self.organisms = {}
+        self.food = EntityList()
+
+
+class ChunkedFood:
+    """
+    All the food of a TiledEnvironment, chunk after chunk: it is what env.food is for everybody (the food
+    loop only needs it to tell whether an item is still around).
+    """
+    def __init__(self, env):
+        self.env = env
+        self.count = 0
+        # Chunks that had food removed since the last compact()
+        self.holed = set()
+
+    def append(self, food):
+        _, chunk = self.env.chunk_at(food.coord)
+        chunk.food.append(food)
+        self.count += 1
+
+    def remove(self, food):
+        key = self.env.chunk_key(food.coord)
+        chunk = self.env.chunks[key]
+        chunk.food.remove(food)
+        self.count -= 1
+        self.holed.add(key)
+        self.env.drop_if_empty(key, chunk)
+
+    def __iter__(self):
+        for chunk in list(self.env.chunks.values()):
+            yield from chunk.food
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, food):
+        chunk = self.env.chunks.get(self.env.chunk_key(food.coord))
+        return chunk is not None and food in chunk.food
+
+    def compact(self):
+        for key in self.holed:
+            chunk = self.env.chunks.get(key)
+            if chunk is not None:
+                chunk.food.compact()
+        self.holed.clear()
+
+
+class TiledEnvironment(Environment):
+    """
+    Same world and same rules as Environment, for very large maps where life is sparse: the grid is split
+    into chunks of chunk_size x chunk_size cells, and queries (the renderer, the inspector) only go through
+    the chunks they overlap.
+
+    Stepping works like in Environment: every organism moves every step, wherever it is, and food only
+    wakes up for its events (see lifecycle.py). What the chunks save is space and lookups: chunks with
+    nothing in them are not stored at all, so empty space costs nothing.
+
+    Organisms are handed off from chunk to chunk as they move (across the wrap-around edges too).
+    """
+    def __init__(self, *args, chunk_size=64, **kwargs):
+        self.chunk_size = chunk_size
+        super().__init__(*args, **kwargs)
+
+    def create_storage(self):
+        super().create_storage()
+        self.chunks = {}
+        self.food = ChunkedFood(self)
+
+    def populate(self):
+        super().populate()
+        for organism in self.population:
+            self.enter_chunk(organism)
+
+    def chunk_key(self, coord):
+        return coord[0] // self.chunk_size, coord[1] // self.chunk_size
+
+    def chunk_at(self, coord):
+        key = self.chunk_key(coord)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.chunks[key] = Chunk()
+        return key, chunk
+
+    def enter_chunk(self, organism):
+        _, chunk = self.chunk_at(organism.coord)
+        chunk.organisms[organism] = None
+
+    def leave_chunk(self, organism, coord):
+        key = self.chunk_key(coord)
+        chunk = self.chunks[key]
+        chunk.organisms.pop(organism, None)
+        self.drop_if_empty(key, chunk)
+
+    def drop_if_empty(self, key, chunk):
+        if not chunk.organisms and not len(chunk.food):
+            del self.chunks[key]
+
+    def add_organism(self, organism):
+        super().add_organism(organism)
+        self.enter_chunk(organism)
+
+    def remove_organism(self, organism):
+        super().remove_organism(organism)
+        self.leave_chunk(organism, organism.coord)
+
+    def move_organism(self, organism, old_coord):
+        super().move_organism(organism, old_coord)
+        if self.chunk_key(organism.coord) != self.chunk_key(old_coord):
+            self.leave_chunk(organism, old_coord)
+            self.enter_chunk(organism)
+
+    def entities_in_area(self, x0, y0, x1, y1):
+        organisms, food = [], []
+        size = self.chunk_size
+        for cx in range(x0 // size, (x1 - 1) // size + 1):
+            for cy in range(y0 // size, (y1 - 1) // size + 1):
+                chunk = self.chunks.get((cx, cy))
+                if chunk is None:
+                    continue
+                # Organisms sharing a cell come in the order of the index, like in entities_in, so that full and
+                # incremental redraws stack them the same way
+                cells = dict.fromkeys(organism.coord for organism in chunk.organisms
+                                      if x0 <= organism.pos_x < x1 and y0 <= organism.pos_y < y1)
+                organisms += [organism for cell in cells for organism in self.organism_index.get_all(cell)]
+                food += [food for food in chunk.food if x0 <= food.pos_x < x1 and y0 <= food.pos_y < y1]
+        return organisms, food
+
+    def sidebar_info_text(self):
+        info_text = super().sidebar_info_text()
+        inhabited = sum(1 for chunk in self.chunks.values() if chunk.organisms)
+        info_text += f"Chunks: {inhabited} with organisms / {len(self.chunks)}\n"
+        return info_text